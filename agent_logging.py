@@ -4,13 +4,112 @@
 Записывает все ответы агентов (генераторов, критика) в лог-файлы
 для последующего анализа и отладки. Каждый конспект создает
 отдельный лог-файл с датой и темой в названии.
+
+Дескрипторы лог-файлов открываются один раз и кэшируются, а записи
+сбрасываются на диск пачками (см. настройки LOG_* в config.py).
+Узлы графа, работающие в цикле событий, пишут лог через
+log_agent_response_async(): сериализация и запись выполняются
+в фоновом потоке и не задерживают узел.
 """
 
 import os
-import json
+import io
+import time
+import queue
+import atexit
+import logging
+import threading
 from datetime import datetime
-from typing import Optional
-from config import LOGS_DIR
+from typing import Dict, Optional
+
+# orjson сериализует сразу в UTF-8 байты и заметно быстрее stdlib json.
+# Если пакет не установлен, используем стандартный json.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+from config import (
+    LOGS_DIR,
+    LOG_BUFFER_SIZE,
+    LOG_FLUSH_ENTRIES,
+    LOG_FLUSH_INTERVAL,
+    LOG_MAX_OPEN_FILES,
+    LOG_QUEUE_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+# Кэш открытых файлов лога: {log_filename: handle}
+_log_handles: Dict[str, io.BufferedWriter] = {}
+
+# Состояние буфера по файлам: {log_filename: (записей с последнего сброса, время сброса)}
+_log_pending: Dict[str, tuple] = {}
+
+# Блокировка для потокобезопасной записи (Streamlit работает в нескольких потоках)
+_log_lock = threading.Lock()
+
+# Флаг: директория для логов уже создана в этом процессе
+_logs_dir_ready = False
+
+# Записи лога, ожидающие фоновой записи (см. log_agent_response_async)
+# Очередь ограничена, чтобы при медленном диске память не росла без предела;
+# записи сверх лимита отбрасываются и подсчитываются
+_log_queue: "queue.Queue[tuple]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_log_dropped = 0
+
+# Фоновый поток, который записывает записи из очереди
+_log_writer_thread: Optional[threading.Thread] = None
+_log_writer_lock = threading.Lock()
+
+
+# Шаблон строки лога для orjson: набор и порядок ключей записи фиксированы,
+# поэтому их JSON-представление подготовлено заранее, а при записи
+# сериализуются только значения (без построения словаря)
+_LOG_LINE_TEMPLATE = (
+    b'{"timestamp":%b,"chat_uuid":%b,"agent_type":%b,"topic":%b,'
+    b'"iteration":%b,"response":%b,"metadata":%b}\n'
+)
+
+
+def _dumps_line(
+    timestamp: str,
+    chat_uuid: str,
+    agent_type: str,
+    topic: str,
+    iteration: int,
+    response: str,
+    metadata: dict
+) -> bytes:
+    """
+    Сериализует запись лога в строку JSONL (UTF-8 байты с переводом строки).
+    
+    Кириллица сохраняется без экранирования. Нестроковые ключи
+    (например, номера генераторов в critiques_by_generator) приводятся к строкам.
+    """
+    if orjson is not None:
+        dumps = orjson.dumps
+        return _LOG_LINE_TEMPLATE % (
+            dumps(timestamp),
+            dumps(chat_uuid),
+            dumps(agent_type),
+            dumps(topic),
+            dumps(iteration),
+            dumps(response),
+            dumps(metadata, option=orjson.OPT_NON_STR_KEYS),
+        )
+    
+    log_entry = {
+        "timestamp": timestamp,      # Время записи
+        "chat_uuid": chat_uuid,      # UUID чата (сквозной идентификатор)
+        "agent_type": agent_type,     # Тип агента
+        "topic": topic,              # Тема конспекта
+        "iteration": iteration,       # Номер итерации
+        "response": response,         # Полный ответ агента
+        "metadata": metadata          # Дополнительные данные
+    }
+    return (json.dumps(log_entry, ensure_ascii=False) + "\n").encode("utf-8")
 
 
 def init_logs_dir():
@@ -19,8 +118,83 @@ def init_logs_dir():
     
     Вызывается автоматически перед записью в лог,
     чтобы гарантировать существование директории.
+    Системный вызов выполняется только один раз за процесс.
     """
+    global _logs_dir_ready
+    if _logs_dir_ready:
+        return
     os.makedirs(LOGS_DIR, exist_ok=True)
+    _logs_dir_ready = True
+
+
+def _get_log_handle(log_filename: str) -> io.BufferedWriter:
+    """
+    Возвращает закэшированный буферизованный дескриптор лог-файла.
+    
+    Файл открывается один раз в режиме бинарной дозаписи. Если открыто
+    слишком много файлов, самый старый закрывается (с записью его буфера).
+    Вызывается под _log_lock.
+    """
+    handle = _log_handles.get(log_filename)
+    if handle is None:
+        if len(_log_handles) >= LOG_MAX_OPEN_FILES:
+            # dict сохраняет порядок вставки - первый ключ самый старый
+            oldest = next(iter(_log_handles))
+            _log_handles.pop(oldest).close()
+            _log_pending.pop(oldest, None)
+        log_path = os.path.join(LOGS_DIR, log_filename)
+        handle = open(log_path, "ab", buffering=LOG_BUFFER_SIZE)
+        _log_handles[log_filename] = handle
+        _log_pending[log_filename] = (0, time.monotonic())
+    return handle
+
+
+def _flush_pending_locked():
+    """
+    Сбрасывает на диск буферы файлов, в которых есть несброшенные записи.
+    Вызывается под _log_lock.
+    """
+    now = time.monotonic()
+    for log_filename, (pending, _) in _log_pending.items():
+        if pending:
+            _log_handles[log_filename].flush()
+            _log_pending[log_filename] = (0, now)
+
+
+def sync_logs():
+    """
+    Дожидается записи ожидающих в очереди записей и сбрасывает буферы
+    лог-файлов на диск, не закрывая их.
+    
+    Вызывается по завершении запуска графа: последние записи запуска
+    не должны оставаться в буфере до следующей записи или выхода
+    процесса (atexit не выполняется, например, при SIGTERM).
+    """
+    if _log_writer_thread is not None:
+        _log_queue.join()
+    with _log_lock:
+        _flush_pending_locked()
+
+
+def flush_logs():
+    """
+    Записывает ожидающие в очереди записи, сбрасывает на диск буферы
+    всех открытых лог-файлов и закрывает их.
+    
+    Регистрируется через atexit, чтобы при завершении процесса
+    ни одна запись не потерялась. Можно вызывать и вручную.
+    """
+    # Сначала дожидаемся записей, еще не взятых фоновым потоком
+    if _log_writer_thread is not None:
+        _log_queue.join()
+    with _log_lock:
+        for handle in _log_handles.values():
+            handle.close()
+        _log_handles.clear()
+        _log_pending.clear()
+
+
+atexit.register(flush_logs)
 
 
 def log_agent_response(
@@ -76,28 +250,111 @@ def log_agent_response(
         ...     metadata={'style': 'Структурный план', 'has_file_content': True}
         ... )
     """
+    # Получаем текущее время для временной метки
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    _write_entry(
+        timestamp, agent_type, log_filename, topic, iteration, response, chat_uuid, metadata
+    )
+
+
+def _write_entry(
+    timestamp: str,
+    agent_type: str,
+    log_filename: str,
+    topic: str,
+    iteration: int,
+    response: str,
+    chat_uuid: str,
+    metadata: Optional[dict]
+):
+    """Сериализует запись лога и пишет ее в буфер лог-файла."""
     # Убеждаемся, что директория для логов существует
     init_logs_dir()
     
-    # Получаем текущее время для временной метки
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Формируем запись лога в формате JSONL (JSON Lines)
+    # Каждая запись на новой строке для удобства чтения и обработки
+    line = _dumps_line(
+        timestamp, chat_uuid, agent_type, topic, iteration, response, metadata or {}
+    )
     
-    log_path = os.path.join(LOGS_DIR, log_filename)
+    # Пишем в буфер закэшированного файла, а на диск сбрасываем пачками:
+    # по количеству записей или по времени с последнего сброса
+    with _log_lock:
+        handle = _get_log_handle(log_filename)
+        handle.write(line)
+        pending, last_flush = _log_pending[log_filename]
+        pending += 1
+        now = time.monotonic()
+        if pending >= LOG_FLUSH_ENTRIES or now - last_flush >= LOG_FLUSH_INTERVAL:
+            handle.flush()
+            pending, last_flush = 0, now
+        _log_pending[log_filename] = (pending, last_flush)
+
+
+def _log_writer():
+    """Цикл фонового потока: записывает в файлы записи лога из очереди."""
+    while True:
+        try:
+            entry = _log_queue.get(timeout=LOG_FLUSH_INTERVAL)
+        except queue.Empty:
+            # Новых записей нет дольше интервала сброса - записываем на диск
+            # то, что осталось в буферах, не дожидаясь следующей записи
+            with _log_lock:
+                _flush_pending_locked()
+            continue
+        try:
+            _write_entry(*entry)
+        except Exception:
+            # Ошибка записи лога не должна останавливать фоновый поток
+            logger.exception("Не удалось записать лог агента %s", entry[1])
+        finally:
+            _log_queue.task_done()
+
+
+def log_agent_response_async(
+    agent_type: str,
+    log_filename: str,
+    topic: str,
+    iteration: int,
+    response: str,
+    chat_uuid: str,
+    metadata: Optional[dict] = None
+):
+    """
+    Ставит ответ агента в очередь на запись в лог-файл и сразу возвращается.
     
-    # Формируем запись лога
-    log_entry = {
-        "timestamp": timestamp,      # Время записи
-        "chat_uuid": chat_uuid,      # UUID чата (сквозной идентификатор)
-        "agent_type": agent_type,     # Тип агента
-        "topic": topic,              # Тема конспекта
-        "iteration": iteration,       # Номер итерации
-        "response": response,         # Полный ответ агента
-        "metadata": metadata or {}    # Дополнительные данные
-    }
+    Та же запись, что и у log_agent_response() (временная метка берется
+    в момент вызова), но сериализация и запись выполняются фоновым потоком.
+    Фоновый поток запускается при первом вызове. Ожидающие записи
+    дописываются в flush_logs(), в том числе при завершении процесса.
+    Вызов никогда не блокируется: если очередь заполнена (LOG_QUEUE_SIZE),
+    запись отбрасывается с предупреждением в logging.
     
-    # Записываем в файл в формате JSONL (JSON Lines)
-    # Каждая запись на новой строке для удобства чтения и обработки
-    # ensure_ascii=False сохраняет кириллицу без экранирования
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
-
+    Args:
+        См. log_agent_response()
+    """
+    global _log_writer_thread, _log_dropped
+    
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    with _log_writer_lock:
+        if _log_writer_thread is None:
+            _log_writer_thread = threading.Thread(
+                target=_log_writer,
+                name="consilium-log-writer",
+                daemon=True
+            )
+            _log_writer_thread.start()
+    
+    try:
+        # Без ожидания: вызов идет из общего цикла событий, и медленный диск
+        # не должен останавливать узлы всех сессий
+        _log_queue.put_nowait(
+            (timestamp, agent_type, log_filename, topic, iteration, response, chat_uuid, metadata)
+        )
+    except queue.Full:
+        _log_dropped += 1
+        logger.warning(
+            "Очередь лога переполнена, запись %s отброшена (всего отброшено: %d)",
+            agent_type, _log_dropped
+        )
@@ -0,0 +1,254 @@
+"""
+Модуль для вывода статуса работы агентов.
+
+Содержит функцию write_status() и классы DeferredStatus и DebouncedStatus,
+через которые узлы графа пишут сообщения о ходе работы в виджет
+st.session_state.status. Каждая запись в виджет - это обновление UI
+в Streamlit, поэтому сообщения узла накапливаются: DeferredStatus
+отображает только последнее, а DebouncedStatus (для длительных узлов) -
+не чаще одного раза за STATUS_DEBOUNCE_INTERVAL.
+
+Граф агентов выполняется в фоновом цикле событий (см. async_runtime.py),
+а виджеты Streamlit можно обновлять только из потока скрипта. Поэтому
+во время работы графа сообщения попадают в очередь, привязанную через
+bind_status_queue(), а поток скрипта выводит их drain_status_queue().
+
+Для длительных операций (потоковый ответ LLM) есть write_progress():
+ее строка в статусе обновляется на месте, а не добавляется заново.
+
+Streamlit импортируется лениво, при первой записи статуса: модули
+агентов можно импортировать и без UI (например, в тестах или
+утилитах для разбора логов). Вне сессии Streamlit (нет контекста
+скрипта или виджета статуса) сообщения пишутся в стандартный logging.
+"""
+
+import logging
+import queue
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from config import STATUS_DEBOUNCE_INTERVAL, STATUS_DEBOUNCE_MAX_PENDING
+
+
+logger = logging.getLogger(__name__)
+
+# Очередь сообщений статуса текущего запуска графа
+# ContextVar наследуется задачами asyncio и потоками, в которых
+# LangGraph выполняет синхронные узлы
+_status_queue: ContextVar[Optional[queue.SimpleQueue]] = ContextVar(
+    "status_queue", default=None
+)
+
+
+def _get_status_widget():
+    """
+    Возвращает виджет статуса текущей сессии Streamlit.
+    
+    None - если Streamlit не установлен, код выполняется вне сессии
+    (нет контекста скрипта, например при вызове узла напрямую) или
+    виджет статуса еще не создан.
+    """
+    try:
+        import streamlit as st
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return None
+    return st.session_state.get("status")
+
+
+def _write_progress_to_widget(progress_lines: dict, key: str, message: Optional[str]):
+    """Обновляет (или убирает при message=None) строку прогресса в виджете статуса."""
+    placeholder = progress_lines.get(key)
+    if message is None:
+        if placeholder is not None:
+            placeholder.empty()
+            del progress_lines[key]
+        return
+    if placeholder is None:
+        status = _get_status_widget()
+        if status is None:
+            logger.debug(message)
+            return
+        placeholder = progress_lines[key] = status.empty()
+    placeholder.write(message)
+
+
+def _write_to_widget(message: str):
+    """Выводит сообщение в виджет статуса Streamlit (или в logging вне сессии)."""
+    status = _get_status_widget()
+    if status is None:
+        logger.info(message)
+        return
+    status.write(message)
+
+
+def write_status(message: str):
+    """
+    Выводит сообщение в виджет статуса Streamlit.
+    
+    Если в текущем контексте привязана очередь статуса, сообщение
+    кладется в нее и будет выведено потоком скрипта.
+    
+    Args:
+        message: Текст сообщения о ходе работы
+    """
+    status_queue = _status_queue.get()
+    if status_queue is not None:
+        status_queue.put((None, message))
+        return
+    _write_to_widget(message)
+
+
+def write_progress(key: str, message: Optional[str]):
+    """
+    Обновляет строку прогресса в статусе (например, хвост потокового ответа).
+    
+    Каждая запись с тем же key заменяет предыдущую, а не добавляет новую
+    строку; message=None убирает строку. Строки прогресса выводятся только
+    во время запуска графа (через очередь статуса), иначе - в logging.
+    
+    Args:
+        key: Идентификатор строки прогресса (например, "generator_1")
+        message: Текст строки или None, чтобы убрать ее
+    """
+    status_queue = _status_queue.get()
+    if status_queue is None:
+        if message is not None:
+            logger.debug(message)
+        return
+    status_queue.put((key, message))
+
+
+def bind_status_queue(status_queue: queue.SimpleQueue):
+    """
+    Привязывает очередь статуса к текущему контексту выполнения.
+    
+    Вызывается в начале корутины запуска графа: все узлы, запущенные
+    из нее, пишут статус в эту очередь.
+    
+    Args:
+        status_queue: Очередь, которую вычитывает поток скрипта Streamlit
+    """
+    _status_queue.set(status_queue)
+
+
+def drain_status_queue(status_queue: queue.SimpleQueue, progress_lines: dict):
+    """
+    Выводит в виджет статуса все накопившиеся в очереди сообщения.
+    
+    Должна вызываться из потока скрипта Streamlit.
+    
+    Args:
+        status_queue: Очередь, привязанная через bind_status_queue()
+        progress_lines: Строки прогресса текущего запуска графа (заполняется здесь)
+    """
+    items = []
+    while True:
+        try:
+            items.append(status_queue.get_nowait())
+        except queue.Empty:
+            break
+    
+    # Из нескольких обновлений одной строки прогресса выводим только последнее
+    latest_progress = {key: i for i, (key, _) in enumerate(items) if key is not None}
+    for i, (key, message) in enumerate(items):
+        if key is None:
+            _write_to_widget(message)
+        elif latest_progress[key] == i:
+            _write_progress_to_widget(progress_lines, key, message)
+
+
+class DeferredStatus:
+    """
+    Отложенная запись в статус для одного вызова узла графа.
+    
+    write() только запоминает сообщение, а при выходе из блока with
+    (в том числе по исключению) в виджет статуса выводится последнее.
+    
+    Example:
+        >>> with DeferredStatus() as status:
+        ...     status.write("Критик анализирует черновики...")
+        ...     status.write("Критик вынес вердикт.")
+        # В UI появится только "Критик вынес вердикт."
+    """
+    
+    def __init__(self):
+        self._last = None
+    
+    def write(self, message: str, force: bool = False):
+        """
+        Запоминает сообщение для вывода при flush().
+        
+        С force=True сообщение выводится сразу (для ошибок, которые
+        не должны заменяться следующими сообщениями).
+        """
+        self._last = message
+        if force:
+            self.flush()
+    
+    def flush(self):
+        """Выводит последнее запомненное сообщение в виджет статуса."""
+        if self._last is not None:
+            write_status(self._last)
+            self._last = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+
+class DebouncedStatus(DeferredStatus):
+    """
+    Статус с прореживанием для длительных узлов графа.
+    
+    В отличие от DeferredStatus, сообщения выводятся и во время работы
+    узла, но не чаще одного раза за interval секунд: write() выводит
+    последнее сообщение, если с прошлого вывода прошло достаточно времени
+    или накопилось max_pending сообщений. При выходе из блока with
+    выводится последнее сообщение.
+    
+    Example:
+        >>> with DebouncedStatus() as status:
+        ...     status.write("Генераторы готовят черновики...")  # выводится сразу
+        ...     status.write("Генераторы [1, 2, 3] работают...")  # запоминается
+        ...     status.write("Ошибка у Генератора 2: ...", force=True)  # выводится сразу
+        # В UI: первое сообщение и ошибка; "работают..." вытеснено ошибкой
+    """
+    
+    def __init__(
+        self,
+        interval: float = STATUS_DEBOUNCE_INTERVAL,
+        max_pending: int = STATUS_DEBOUNCE_MAX_PENDING
+    ):
+        super().__init__()
+        self._interval = interval
+        self._max_pending = max_pending
+        self._pending = 0
+        self._last_flush = float("-inf")
+    
+    def write(self, message: str, force: bool = False):
+        """
+        Запоминает сообщение и выводит его, если пора.
+        
+        С force=True сообщение выводится сразу, без прореживания:
+        так ошибки не вытесняются сообщениями о ходе работы.
+        """
+        self._last = message
+        self._pending += 1
+        if (force
+                or self._pending >= self._max_pending
+                or time.monotonic() - self._last_flush >= self._interval):
+            self.flush()
+    
+    def flush(self):
+        """Выводит последнее запомненное сообщение в виджет статуса."""
+        super().flush()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
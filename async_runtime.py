@@ -0,0 +1,77 @@
+"""
+Модуль фонового цикла событий asyncio.
+
+Streamlit выполняет скрипт синхронно, а узлы графа агентов асинхронные.
+Вместо asyncio.run() на каждый запрос используется один долгоживущий
+цикл событий в фоновом потоке: закэшированные клиенты LLM держат
+асинхронные HTTP-соединения, привязанные к циклу, в котором они созданы,
+и не должны переживать его закрытие между запросами.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import wait
+from typing import Any, Awaitable, Callable, Optional
+
+
+# Фоновый цикл событий (создается при первом использовании)
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Возвращает фоновый цикл событий, запуская его поток при первом вызове.
+    
+    Returns:
+        asyncio.AbstractEventLoop: Цикл событий, работающий в daemon-потоке
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever,
+                name="consilium-event-loop",
+                daemon=True
+            ).start()
+    return _loop
+
+
+def run_async(
+    coro: Awaitable,
+    on_wait: Optional[Callable[[], None]] = None,
+    poll_interval: float = 0.1
+) -> Any:
+    """
+    Выполняет корутину в фоновом цикле событий и блокирует до ее завершения.
+    
+    Пока корутина выполняется, вызывающий поток каждые poll_interval секунд
+    вызывает on_wait (и еще раз после завершения). Так поток Streamlit
+    может выводить в UI сообщения, которые узлы графа передают ему через очередь.
+    
+    В фоновом потоке нет контекста сессии Streamlit: корутина не должна
+    вызывать элементы st.* и функции с @st.cache_resource/@st.cache_data
+    (при промахе кэша они выводят индикатор и падают с NoSessionContext).
+    
+    Args:
+        coro: Корутина для выполнения
+        on_wait: Функция, вызываемая в вызывающем потоке во время ожидания
+        poll_interval: Интервал вызова on_wait в секундах
+    
+    Returns:
+        Any: Результат корутины (исключения корутины пробрасываются)
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    try:
+        while True:
+            wait([future], timeout=poll_interval)
+            if on_wait is not None:
+                on_wait()
+            if future.done():
+                break
+    except BaseException:
+        # Скрипт прерван (например, Streamlit перезапустил его) - отменяем работу
+        future.cancel()
+        raise
+    return future.result()
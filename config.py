@@ -18,6 +18,12 @@ load_dotenv()
 # База данных находится в поддиректории data/
 DB_PATH = os.path.join("data", "history.db")
 
+# Фоновая запись сообщений в БД (add_message_async):
+# накопленные сообщения вставляются одной транзакцией, когда набралось
+# MESSAGE_BATCH_SIZE строк или прошло MESSAGE_FLUSH_INTERVAL секунд
+MESSAGE_BATCH_SIZE = 50
+MESSAGE_FLUSH_INTERVAL = 0.02
+
 # Директория для хранения логов работы агентов
 # Каждый конспект создает отдельный лог-файл с датой и темой
 LOGS_DIR = "logs"
@@ -26,6 +32,27 @@ LOGS_DIR = "logs"
 # Промпты определяют поведение генераторов, критика и редактора
 PROMPTS_DIR = "prompts"
 
+# --- НАСТРОЙКИ ЛОГИРОВАНИЯ ---
+
+# Размер буфера файла лога в байтах (64 KiB)
+# Записи копятся в памяти и сбрасываются на диск пачками
+LOG_BUFFER_SIZE = 1 << 16
+
+# Буфер сбрасывается на диск после такого количества записей...
+LOG_FLUSH_ENTRIES = 32
+
+# ...или если с последнего сброса прошло больше указанного времени (в секундах)
+LOG_FLUSH_INTERVAL = 2.0
+
+# Максимальное количество одновременно открытых лог-файлов
+# Каждый запуск пишет в свой файл, поэтому самые старые дескрипторы закрываются
+LOG_MAX_OPEN_FILES = 8
+
+# Максимальное число записей лога, ожидающих фоновой записи
+# (log_agent_response_async); при переполнении новые записи отбрасываются
+# с предупреждением, чтобы не блокировать цикл событий
+LOG_QUEUE_SIZE = 1000
+
 # --- ПАРАМЕТРЫ РАБОТЫ АГЕНТОВ ---
 
 # Максимальное количество итераций улучшения черновиков
@@ -36,6 +63,56 @@ MAX_ITERATIONS = 3
 # Защита от бесконечных циклов в работе графа
 GRAPH_RECURSION_LIMIT = 15
 
+# Максимальное число узлов графа, выполняемых одновременно
+# (параллельные ветви LangGraph в рамках одного шага)
+GRAPH_MAX_CONCURRENCY = 3
+
+# Максимальное время ожидания ответа одного генератора (в секундах)
+# Генераторы работают параллельно, и медленный ключ не должен задерживать остальных
+GENERATOR_TIMEOUT = 180
+
+# Повторы запроса генератора при временных ошибках API (обрыв, 429, 5xx)
+# Число попыток, включая первую
+GENERATOR_RETRY_ATTEMPTS = 3
+# Максимальная пауза между попытками (в секундах), пауза растет экспоненциально
+GENERATOR_RETRY_MAX_WAIT = 10
+
+# Кэш недавних ответов генераторов на одинаковые запросы доработки в чате
+# Размер кэша (число ответов) и время хранения (в секундах)
+GENERATOR_RESULT_CACHE_SIZE = 256
+GENERATOR_RESULT_CACHE_TTL = 300
+
+# Прореживание сообщений статуса длительных узлов (DebouncedStatus)
+# Минимальный интервал между выводами (в секундах) и число сообщений,
+# после которого последнее выводится без ожидания интервала
+STATUS_DEBOUNCE_INTERVAL = 0.15
+STATUS_DEBOUNCE_MAX_PENDING = 5
+
+# Ответы генераторов и редактора принимаются потоком; текст выводится в статус
+# не чаще одного раза за интервал (в секундах), чтобы не перегружать UI
+STREAM_STATUS_INTERVAL = 0.2
+# Сколько последних символов потокового ответа показывать в статусе
+GENERATOR_STREAM_PREVIEW_CHARS = 200
+
+# Ограничения хранилища сессий чата генераторов
+# Максимальное число сессий (пар чат-генератор) в памяти процесса
+CHAT_SESSIONS_MAX = 1024
+# Время жизни сессии без обращений (в секундах)
+CHAT_SESSION_TTL = 3600
+# Максимальное число сообщений в сессии; старые пары запрос-ответ отбрасываются
+CHAT_SESSION_MAX_MESSAGES = 20
+
+# Ограничения сохраненных состояний графа, ожидающих ответа пользователя
+# Максимальное число чатов с приостановленным графом
+PAUSED_GRAPHS_MAX = 256
+# Время ожидания ответа на уточняющие вопросы (в секундах); после него
+# состояние удаляется, и следующее сообщение начинает новый запрос
+PAUSED_GRAPH_TTL = 3600
+
+# Запросы короче этого числа символов (и приветствия) не запускают граф агентов:
+# пользователю сразу предлагается сформулировать тему конспекта
+TRIVIAL_PROMPT_MIN_LENGTH = 3
+
 # --- НАСТРОЙКИ LLM (Language Learning Model) ---
 
 # API ключ по умолчанию для работы с Deepseek API
@@ -60,10 +137,39 @@ DEFAULT_BASE_URL = base_url
 # Может быть изменена через переменную окружения DEEPSEEK_MODEL
 DEFAULT_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
 
+# Модель для Prompter-а: проверка запроса - легкая задача классификации,
+# для нее подходит самая быстрая доступная модель
+# Может быть изменена через переменную окружения DEEPSEEK_PROMPTER_MODEL
+PROMPTER_MODEL = os.getenv("DEEPSEEK_PROMPTER_MODEL", DEFAULT_MODEL)
+
 # Температура для генерации текста
 # Значение 0.7 обеспечивает баланс между креативностью и точностью
 DEFAULT_TEMPERATURE = 0.7
 
+# Температура для Prompter-а: проверка запроса должна быть детерминированной,
+# чтобы одинаковые запросы можно было отвечать из кэша
+PROMPTER_TEMPERATURE = 0.0
+
+# Максимальное число ответов Prompter-а в кэше (в памяти процесса)
+PROMPTER_CACHE_SIZE = 256
+
+# Ограничение длины ответа Prompter-а (в токенах)
+# Ответ - небольшой JSON, но prepared_prompt повторяет запрос пользователя,
+# поэтому запас больше, чем нужно для одних вопросов
+PROMPTER_MAX_TOKENS = 512
+
+# Минимальное число слов в запросе, при котором Prompter может пропустить
+# вызов LLM, если в запросе явно есть роль, контекст и задача
+PROMPTER_SKIP_MIN_WORDS = 5
+
+# Общий асинхронный HTTP-клиент для всех экземпляров LLM
+# Максимальное число соединений с API (запросы генераторов по HTTP/2
+# мультиплексируются в одном соединении)
+HTTP_MAX_CONNECTIONS = 16
+# Таймауты HTTP-запросов (в секундах): установка соединения и ожидание данных
+HTTP_CONNECT_TIMEOUT = 5.0
+HTTP_TIMEOUT = 120.0
+
 # --- НАСТРОЙКИ STREAMLIT UI ---
 
 # Заголовок страницы в браузере
@@ -1,20 +1,57 @@
 """
 Модуль узлов критика и редактора.
 
-Содержит функции critic_node() и editor_node() для анализа черновиков
-и создания финального конспекта. Вынесен в отдельный модуль для
+Содержит асинхронные функции critic_node() и editor_node() для анализа
+черновиков и создания финального конспекта. Вынесен в отдельный модуль для
 соблюдения ограничения на количество строк.
 """
 
 import json
-import streamlit as st
+import time
+import itertools
 
-from llm_setup import get_llm, critic_prompt_template, editor_prompt_template
-from agent_logging import log_agent_response
+# orjson парсит JSON заметно быстрее stdlib json.
+# orjson.JSONDecodeError наследуется от json.JSONDecodeError,
+# поэтому обработка ошибок парсинга не меняется.
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+from llm_setup import (
+    get_llm,
+    critic_prompt_template,
+    editor_prompt_template,
+    strip_code_fence
+)
+from agent_logging import log_agent_response_async
+from agent_status import DeferredStatus, write_progress
+from config import STREAM_STATUS_INTERVAL
 from decision import AgentState
 
 
-def critic_node(state: AgentState) -> dict:
+# Цепочки "промпт | LLM" собираются один раз при первом вызове узла
+_critic_chain = None
+_editor_chain = None
+
+
+def _get_critic_chain():
+    """Возвращает закэшированную цепочку промпта критика и LLM."""
+    global _critic_chain
+    if _critic_chain is None:
+        _critic_chain = critic_prompt_template() | get_llm()
+    return _critic_chain
+
+
+def _get_editor_chain():
+    """Возвращает закэшированную цепочку промпта редактора и LLM."""
+    global _editor_chain
+    if _editor_chain is None:
+        _editor_chain = editor_prompt_template() | get_llm()
+    return _editor_chain
+
+
+async def critic_node(state: AgentState) -> dict:
     """
     Узел критика: анализирует три черновика и выносит вердикт.
     
@@ -25,7 +62,9 @@ def critic_node(state: AgentState) -> dict:
         state: Состояние графа с тремя черновиками
     
     Returns:
-        dict: Обновленное состояние с замечаниями и вопросами
+        dict: Обновленное состояние с замечаниями и вопросами, а также
+              склеенными строками черновиков и замечаний для редактора
+              и текстом замечаний для каждого генератора
     
     Process:
         1. Отправляет черновики критику через LLM
@@ -33,101 +72,108 @@ def critic_node(state: AgentState) -> dict:
         3. Логирует ответ критика
         4. Обрабатывает ошибки парсинга (если критик вернул не JSON)
     """
-    st.session_state.status.write("Критик анализирует черновики...")
-    
-    llm = get_llm()
-    chain = critic_prompt_template | llm
-    
-    # Отправляем черновики критику
-    response = chain.invoke({
-        "topic": state["topic"],
-        "draft_1": state["drafts"][0],
-        "draft_2": state["drafts"][1],
-        "draft_3": state["drafts"][2],
-    })
-    
-    iteration = state.get("iteration_count", 0)
-    
-    try:
-        # Пытаемся распарсить JSON ответ
-        # Удаляем markdown код-блоки, если они есть
-        cleaned_response = (
-            response.content
-            .strip()
-            .lstrip('```json')
-            .lstrip('```')
-            .rstrip('```')
-        )
-        result = json.loads(cleaned_response)
+    with DeferredStatus() as status:
+        status.write("Критик анализирует черновики...")
         
-        # Преобразуем ключи из строк в числа для critiques_by_generator
-        critiques_by_generator = {}
-        if "critiques_by_generator" in result:
-            for key, value in result["critiques_by_generator"].items():
-                critiques_by_generator[int(key)] = value
+        chain = _get_critic_chain()
         
-        # Для обратной совместимости создаем старый формат critiques
-        # (объединяем все замечания в один список)
-        all_critiques = []
-        for gen_num, critiques in critiques_by_generator.items():
-            all_critiques.extend(critiques)
+        # Отправляем черновики критику
+        response = await chain.ainvoke({
+            "topic": state.topic,
+            "draft_1": state.drafts[0],
+            "draft_2": state.drafts[1],
+            "draft_3": state.drafts[2],
+        })
         
-        # Логируем успешный ответ критика
-        log_agent_response(
-            agent_type="critic",
-            log_filename=state["log_filename"],
-            topic=state["topic"],
-            iteration=iteration,
-            response=response.content,
-            chat_uuid=state["chat_uuid"],
-            metadata={
-                "parsed_successfully": True,
-                "critiques_by_generator": critiques_by_generator,
-                "critiques_count": len(all_critiques),
-                "questions_count": len(result.get("questions_for_user", [])),
-                "parsed_result": result
-            }
-        )
+        iteration = state.iteration_count
         
-        st.session_state.status.write("Критик вынес вердикт.")
-        return {
-            "critiques": all_critiques,  # Для обратной совместимости
-            "critiques_by_generator": critiques_by_generator,  # Новая структура
-            "questions_for_user": result.get("questions_for_user", []),
-            "drafts_to_redo": result.get("drafts_to_redo", [])
-        }
+        # Черновики не меняются до следующего прохода генераторов,
+        # поэтому склеиваем их для редактора один раз здесь
+        drafts_joined = "\n\n---\n\n".join(state.drafts)
         
-    except (json.JSONDecodeError, AttributeError) as e:
-        # Если парсинг не удался, логируем ошибку
-        # но продолжаем работу, используя весь ответ как замечание
-        log_agent_response(
-            agent_type="critic",
-            log_filename=state["log_filename"],
-            topic=state["topic"],
-            iteration=iteration,
-            response=response.content,
-            chat_uuid=state["chat_uuid"],
-            metadata={
-                "parsed_successfully": False,
-                "error": str(e),
-                "error_type": type(e).__name__
+        try:
+            # Пытаемся распарсить JSON ответ
+            # Удаляем markdown код-блоки, если они есть
+            cleaned_response = strip_code_fence(response.content)
+            result = json_loads(cleaned_response)
+            
+            # Преобразуем ключи из строк в числа для critiques_by_generator
+            critiques_by_generator = {
+                int(key): value
+                for key, value in result.get("critiques_by_generator", {}).items()
+            }
+            
+            # Для обратной совместимости создаем старый формат critiques
+            # (объединяем все замечания в один список, порядок - по генераторам)
+            all_critiques = list(itertools.chain.from_iterable(critiques_by_generator.values()))
+            
+            # Логируем успешный ответ критика
+            log_agent_response_async(
+                agent_type="critic",
+                log_filename=state.log_filename,
+                topic=state.topic,
+                iteration=iteration,
+                response=response.content,
+                chat_uuid=state.chat_uuid,
+                metadata={
+                    "parsed_successfully": True,
+                    "critiques_by_generator": critiques_by_generator,
+                    "critiques_count": len(all_critiques),
+                    "questions_count": len(result.get("questions_for_user", [])),
+                    "parsed_result": result
+                }
+            )
+            
+            status.write("Критик вынес вердикт.")
+            return {
+                "critiques": all_critiques,  # Для обратной совместимости
+                "critiques_by_generator": critiques_by_generator,  # Новая структура
+                "questions_for_user": result.get("questions_for_user", []),
+                "drafts_to_redo": result.get("drafts_to_redo", []),
+                # Готовые строки для редактора, чтобы не склеивать их повторно
+                "drafts_joined": drafts_joined,
+                "critiques_joined": "\n".join(all_critiques) or "Нет",
+                # И для генераторов: текст замечаний каждому из них
+                "critiques_text_by_generator": {
+                    gen_num: "\n".join(critiques)
+                    for gen_num, critiques in critiques_by_generator.items()
+                },
             }
-        )
         
-        st.session_state.status.write(
-            "Ошибка: Критик вернул некорректный ответ. Считаем, что критики нет."
-        )
-        # Используем весь ответ как одно замечание
-        # По умолчанию переделываем все черновики при ошибке парсинга
-        return {
-            "critiques": [response.content],  # Для обратной совместимости
-            "critiques_by_generator": {1: [response.content], 2: [response.content], 3: [response.content]},
-            "questions_for_user": [],
-            "drafts_to_redo": [1, 2, 3]
-        }
+        except (json.JSONDecodeError, AttributeError) as e:
+            # Если парсинг не удался, логируем ошибку
+            # но продолжаем работу, используя весь ответ как замечание
+            log_agent_response_async(
+                agent_type="critic",
+                log_filename=state.log_filename,
+                topic=state.topic,
+                iteration=iteration,
+                response=response.content,
+                chat_uuid=state.chat_uuid,
+                metadata={
+                    "parsed_successfully": False,
+                    "error": str(e),
+                    "error_type": type(e).__name__
+                }
+            )
+            
+            status.write(
+                "Ошибка: Критик вернул некорректный ответ. Считаем, что критики нет."
+            )
+            # Используем весь ответ как одно замечание
+            # По умолчанию переделываем все черновики при ошибке парсинга
+            return {
+                "critiques": [response.content],  # Для обратной совместимости
+                "critiques_by_generator": {1: [response.content], 2: [response.content], 3: [response.content]},
+                "questions_for_user": [],
+                "drafts_to_redo": [1, 2, 3],
+                "drafts_joined": drafts_joined,
+                "critiques_joined": response.content or "Нет",
+                "critiques_text_by_generator": {1: response.content, 2: response.content, 3: response.content},
+            }
 
 
-def editor_node(state: AgentState) -> dict:
+async def editor_node(state: AgentState) -> dict:
     """
     Узел редактора: собирает финальный конспект из черновиков.
     
@@ -140,18 +186,31 @@ def editor_node(state: AgentState) -> dict:
     Returns:
         dict: Обновленное состояние с финальным конспектом
     """
-    st.session_state.status.write("Редактор готовит итоговый конспект...")
-    
-    llm = get_llm()
-    chain = editor_prompt_template | llm
-    
-    # Отправляем редактору все черновики и замечания
-    response = chain.invoke({
-        "topic": state["topic"],
-        "drafts": "\n\n---\n\n".join(state["drafts"]),
-        "critiques": "\n".join(state.get("critiques", ["Нет"])),
-    })
-    
-    st.session_state.status.write("Финальный конспект готов!")
-    return {"final_summary": response.content}
+    with DeferredStatus() as status:
+        status.write("Редактор готовит итоговый конспект...")
+        
+        chain = _get_editor_chain()
+        
+        # Отправляем редактору все черновики и замечания
+        # (строки заранее склеены в critic_node - редактор всегда идет после критика)
+        # Ответ принимается потоком: конспект появляется в статусе по мере
+        # генерации, а не только после полного ответа
+        chunks = []
+        last_update = time.monotonic()
+        try:
+            async for chunk in chain.astream({
+                "topic": state.topic,
+                "drafts": state.drafts_joined,
+                "critiques": state.critiques_joined,
+            }):
+                chunks.append(chunk.content)
+                now = time.monotonic()
+                if now - last_update >= STREAM_STATUS_INTERVAL:
+                    write_progress("editor", "".join(chunks))
+                    last_update = now
+        finally:
+            write_progress("editor", None)
+        
+        status.write("Финальный конспект готов!")
+        return {"final_summary": "".join(chunks)}
 
@@ -4,6 +4,7 @@
 Обеспечивает все операции с базой данных:
 - Создание и получение чатов
 - Сохранение и загрузка сообщений
+- Фоновая пакетная запись сообщений (add_message_async / flush_messages)
 
 База данных использует SQLite для простоты развертывания
 и не требует отдельного сервера БД.
@@ -11,26 +12,100 @@
 Схема БД инициализируется в модуле db_schema.py.
 """
 
+import queue
 import sqlite3
-import json
+import threading
+import time
 import uuid
-from typing import Optional, List
-from config import DB_PATH
+from contextlib import contextmanager
+
+# orjson сериализует JSON заметно быстрее stdlib json.
+# Если пакет не установлен, используем стандартный json.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+from typing import Iterator, Optional, List
+from config import DB_PATH, MESSAGE_BATCH_SIZE, MESSAGE_FLUSH_INTERVAL
 from db_schema import init_db
 
 
-def get_db_connection():
+# Количество строк, читаемых из курсора за раз в iter_messages()
+MESSAGES_FETCH_SIZE = 128
+
+# Общее соединение с БД для всех потоков скрипта Streamlit
+# Streamlit запускает скрипт в новом потоке почти при каждом действии
+# пользователя, поэтому соединение на поток открывалось бы заново
+# (с повторной настройкой) и не закрывалось. Обращения к общему
+# соединению сериализуются блокировкой; у фонового потока записи
+# сообщений свое соединение.
+_conn: Optional[sqlite3.Connection] = None
+_conn_lock = threading.RLock()
+
+
+def _open_connection() -> sqlite3.Connection:
+    """
+    Открывает и настраивает новое соединение с базой данных.
+    
+    Перед подключением инициализируется схема БД. Настройки:
+    - row_factory = sqlite3.Row для доступа к полям по имени
+    - WAL-журнал и synchronous=NORMAL для меньшего количества fsync
+    - временные таблицы и кэш страниц в памяти
+    """
+    # Схема создается лениво при первом подключении (в пределах процесса
+    # повторные вызовы init_db() не обращаются к файлу БД)
+    init_db()
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")  # ~20 МБ
+    return conn
+
+
+def get_db_connection() -> sqlite3.Connection:
     """
-    Возвращает соединение с базой данных.
+    Возвращает долгоживущее соединение с базой данных, общее для процесса.
+    
+    Соединение открывается при первом обращении (см. _open_connection())
+    и используется всеми потоками скрипта Streamlit.
     
     Returns:
         sqlite3.Connection: Соединение с БД
-        
+    
     Note:
-        Рекомендуется использовать в контекстном менеджере (with statement)
-        для автоматического закрытия соединения.
+        Соединение не нужно закрывать. Работать с ним нужно под
+        блокировкой (см. _locked_connection()). Для транзакций используйте
+        контекстный менеджер (with conn:): он фиксирует изменения
+        или откатывает их при ошибке.
     """
-    return sqlite3.connect(DB_PATH)
+    global _conn
+    with _conn_lock:
+        if _conn is None:
+            _conn = _open_connection()
+        return _conn
+
+
+@contextmanager
+def _locked_connection() -> Iterator[sqlite3.Connection]:
+    """Захватывает общее соединение с БД на время блока with."""
+    with _conn_lock:
+        yield get_db_connection()
+
+
+def _dumps_agent_steps(agent_steps: dict) -> str:
+    """
+    Сериализует agent_steps в JSON строку для хранения в БД.
+    
+    Кириллица сохраняется без экранирования, нестроковые ключи
+    (например, номера генераторов) приводятся к строкам.
+    """
+    if orjson is not None:
+        return orjson.dumps(agent_steps, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    # ensure_ascii=False позволяет сохранять кириллицу без экранирования
+    return json.dumps(agent_steps, ensure_ascii=False)
 
 
 def get_chats() -> List[sqlite3.Row]:
@@ -41,9 +116,7 @@ def get_chats() -> List[sqlite3.Row]:
         List[sqlite3.Row]: Список всех чатов, отсортированный по убыванию даты
                           (самые новые первыми)
     """
-    with get_db_connection() as conn:
-        # Используем row_factory для удобного доступа к полям по имени
-        conn.row_factory = sqlite3.Row
+    with _locked_connection() as conn:
         return conn.execute(
             "SELECT * FROM chats ORDER BY created_at DESC"
         ).fetchall()
@@ -58,18 +131,16 @@ def create_chat(title: str) -> int:
     
     Returns:
         int: ID созданного чата
-        
+    
     Example:
         >>> chat_id = create_chat("Конспект про Python")
         >>> print(chat_id)
         1
     """
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        chat_uuid = str(uuid.uuid4())
-        cursor.execute("INSERT INTO chats (uuid, title) VALUES (?, ?)", (chat_uuid, title))
-        conn.commit()
-        return cursor.lastrowid
+    chat_uuid = str(uuid.uuid4())
+    with _locked_connection() as conn, conn:
+        cursor = conn.execute("INSERT INTO chats (uuid, title) VALUES (?, ?)", (chat_uuid, title))
+    return cursor.lastrowid
 
 
 def get_chat_uuid(chat_id: int) -> Optional[str]:
@@ -82,10 +153,36 @@ def get_chat_uuid(chat_id: int) -> Optional[str]:
     Returns:
         Optional[str]: UUID чата или None, если чат не найден
     """
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        result = cursor.execute("SELECT uuid FROM chats WHERE id = ?", (chat_id,)).fetchone()
-        return result[0] if result else None
+    with _locked_connection() as conn:
+        result = conn.execute("SELECT uuid FROM chats WHERE id = ?", (chat_id,)).fetchone()
+    return result[0] if result else None
+
+
+def iter_messages(chat_id: int) -> Iterator[sqlite3.Row]:
+    """
+    Лениво перебирает сообщения указанного чата.
+    
+    Строки читаются из курсора порциями по MESSAGES_FETCH_SIZE, поэтому
+    весь чат не материализуется в памяти. Подходит для однократного обхода.
+    
+    Args:
+        chat_id: ID чата, для которого нужно получить сообщения
+    
+    Yields:
+        sqlite3.Row: Сообщения в порядке времени создания (самые старые первыми)
+    """
+    with _locked_connection() as conn:
+        cursor = conn.execute(
+            "SELECT * FROM messages WHERE chat_id = ? ORDER BY created_at ASC",
+            (chat_id,)
+        )
+    while True:
+        # Блокировка берется на каждую порцию, а не на весь обход
+        with _conn_lock:
+            batch = cursor.fetchmany(MESSAGES_FETCH_SIZE)
+        if not batch:
+            return
+        yield from batch
 
 
 def get_messages(chat_id: int) -> List[sqlite3.Row]:
@@ -98,13 +195,11 @@ def get_messages(chat_id: int) -> List[sqlite3.Row]:
     Returns:
         List[sqlite3.Row]: Список сообщений, отсортированный по времени создания
                           (самые старые первыми, для хронологического порядка)
+    
+    Note:
+        Если сообщения нужно обойти один раз, используйте iter_messages().
     """
-    with get_db_connection() as conn:
-        conn.row_factory = sqlite3.Row
-        return conn.execute(
-            "SELECT * FROM messages WHERE chat_id = ? ORDER BY created_at ASC",
-            (chat_id,)
-        ).fetchall()
+    return list(iter_messages(chat_id))
 
 
 def add_message(
@@ -131,23 +226,102 @@ def add_message(
         ...     agent_steps={'iteration': 2, 'drafts_count': 3}
         ... )
     """
-    with get_db_connection() as conn:
-        # Преобразуем agent_steps в JSON строку, если он передан
-        # ensure_ascii=False позволяет сохранять кириллицу без экранирования
-        agent_steps_json = (
-            json.dumps(agent_steps, ensure_ascii=False)
-            if agent_steps
-            else None
-        )
-        
+    # Преобразуем agent_steps в JSON строку, если он передан
+    agent_steps_json = _dumps_agent_steps(agent_steps) if agent_steps else None
+    
+    with _locked_connection() as conn, conn:
         conn.execute(
             "INSERT INTO messages (chat_id, author, content, agent_steps) VALUES (?, ?, ?, ?)",
             (chat_id, author, content, agent_steps_json)
         )
-        conn.commit()
 
 
-# Инициализируем БД при импорте модуля
-# Это гарантирует, что таблицы созданы перед использованием
-init_db()
+# --- ФОНОВАЯ ЗАПИСЬ СООБЩЕНИЙ ---
+
+# Очередь сообщений, ожидающих записи: кортежи (chat_id, author, content, agent_steps_json)
+_message_queue: "queue.Queue[tuple]" = queue.Queue()
+
+# Фоновый поток, который пачками записывает сообщения из очереди
+_writer_thread: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+
+# Последняя ошибка фоновой записи (пробрасывается из flush_messages)
+_writer_error: Optional[BaseException] = None
+
+
+def _message_writer():
+    """
+    Цикл фонового потока: забирает сообщения из очереди и вставляет их
+    одной транзакцией (group commit), когда набралось MESSAGE_BATCH_SIZE строк
+    или истек MESSAGE_FLUSH_INTERVAL с момента первого сообщения пачки.
+    """
+    global _writer_error
+    # Собственное соединение потока записи (не конкурирует с потоками скрипта)
+    conn = None
+    while True:
+        batch = [_message_queue.get()]
+        deadline = time.monotonic() + MESSAGE_FLUSH_INTERVAL
+        while len(batch) < MESSAGE_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(_message_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        try:
+            if conn is None:
+                conn = _open_connection()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO messages (chat_id, author, content, agent_steps) VALUES (?, ?, ?, ?)",
+                    batch
+                )
+        except Exception as e:
+            _writer_error = e
+        finally:
+            for _ in batch:
+                _message_queue.task_done()
+
+
+def add_message_async(
+    chat_id: int,
+    author: str,
+    content: str,
+    agent_steps: Optional[dict] = None
+):
+    """
+    Ставит сообщение в очередь на запись в базу данных и сразу возвращается.
+    
+    Параметры совпадают с add_message(). Сообщения записывает фоновый поток
+    пачками, поэтому после серии вызовов нужно вызвать flush_messages(),
+    чтобы гарантировать, что они сохранены (например, перед ответом пользователю).
+    """
+    global _writer_thread
+    # Сериализуем сразу: словарь может измениться, пока сообщение ждет в очереди
+    agent_steps_json = _dumps_agent_steps(agent_steps) if agent_steps else None
+    _message_queue.put((chat_id, author, content, agent_steps_json))
+    
+    # Запускаем фоновый поток при первом использовании
+    with _writer_lock:
+        if _writer_thread is None:
+            _writer_thread = threading.Thread(
+                target=_message_writer,
+                name="consilium-message-writer",
+                daemon=True
+            )
+            _writer_thread.start()
+
 
+def flush_messages():
+    """
+    Блокирует выполнение, пока все сообщения из очереди не будут записаны в БД.
+    
+    Raises:
+        Exception: Ошибка, возникшая при фоновой записи (если была)
+    """
+    global _writer_error
+    _message_queue.join()
+    if _writer_error is not None:
+        error, _writer_error = _writer_error, None
+        raise error
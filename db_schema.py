@@ -7,9 +7,33 @@
 
 import os
 import sqlite3
+import threading
+from contextlib import closing
 from config import DB_PATH
 
 
+# Текущая версия схемы БД, хранится в PRAGMA user_version:
+# 1 - у чатов есть обязательный уникальный uuid
+# 2 - индексы по дате для чатов и сообщений
+CURRENT_SCHEMA_VERSION = 2
+
+# Флаг: схема уже проверена в этом процессе
+# Streamlit перезапускает скрипт при каждом действии пользователя,
+# поэтому повторные вызовы init_db() не должны открывать файл БД
+_initialized = False
+_init_lock = threading.Lock()
+
+
+# SQL-выражение, генерирующее случайный UUID версии 4 в каноническом виде
+# (xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx), вычисляется отдельно для каждой строки
+_SQL_UUID4 = (
+    "lower(hex(randomblob(4))) || '-' || lower(hex(randomblob(2))) || '-4' || "
+    "substr(lower(hex(randomblob(2))), 2) || '-' || "
+    "substr('89ab', abs(random()) % 4 + 1, 1) || "
+    "substr(lower(hex(randomblob(2))), 2) || '-' || lower(hex(randomblob(6)))"
+)
+
+
 def init_db():
     """
     Инициализирует базу данных SQLite и создает необходимые таблицы.
@@ -18,79 +42,114 @@ def init_db():
     1. chats - хранит информацию о чат-сессиях
     2. messages - хранит сообщения пользователя и системы
     
+    А также индексы для выборки чатов и сообщений по дате.
+    
     Автоматически создает директорию data/, если её нет.
+    
+    Функция идемпотентна и дешева при повторных вызовах: в пределах
+    процесса проверка выполняется один раз, а если версия схемы
+    (PRAGMA user_version) актуальна, таблицы не пересоздаются.
     """
-    # Создаем директорию для БД, если она не существует
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    global _initialized
+    if _initialized:
+        return
     
-    # Подключаемся к БД и создаем таблицы
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        
-        # Таблица чатов: хранит метаинформацию о каждой сессии
-        # id - уникальный идентификатор чата
-        # uuid - уникальный идентификатор чата (для сквозного логирования)
-        # title - заголовок чата (первые 50 символов запроса)
-        # created_at - время создания (автоматически)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS chats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                uuid TEXT UNIQUE NOT NULL,
-                title TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Таблица сообщений: хранит все сообщения в чатах
-        # id - уникальный идентификатор сообщения
-        # chat_id - связь с таблицей chats (внешний ключ)
-        # author - автор сообщения ('user' или 'system')
-        # content - текст сообщения
-        # agent_steps - JSON с промежуточными шагами агентов (для отладки)
-        # created_at - время создания (автоматически)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id INTEGER NOT NULL,
-                author TEXT NOT NULL CHECK(author IN ('user', 'system')),
-                content TEXT NOT NULL,
-                agent_steps TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (chat_id) REFERENCES chats (id)
-            )
-        """)
-        
-        # Сохраняем изменения
-        conn.commit()
+    with _init_lock:
+        # Повторная проверка: другой поток мог завершить инициализацию
+        if _initialized:
+            return
+        # Создаем директорию для БД, если она не существует
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
         
-        # Миграция: добавляем UUID для существующих чатов, если поле отсутствует
-        try:
-            cursor.execute("SELECT uuid FROM chats LIMIT 1")
-        except sqlite3.OperationalError:
-            # Поле uuid не существует, добавляем его
-            import uuid
-            cursor.execute("ALTER TABLE chats ADD COLUMN uuid TEXT")
-            # Генерируем UUID для всех существующих чатов
-            existing_chats = cursor.execute("SELECT id FROM chats WHERE uuid IS NULL").fetchall()
-            for (chat_id,) in existing_chats:
-                new_uuid = str(uuid.uuid4())
-                cursor.execute("UPDATE chats SET uuid = ? WHERE id = ?", (new_uuid, chat_id))
-            # Делаем поле обязательным и уникальным
-            conn.commit()
-            # SQLite не поддерживает ALTER COLUMN, поэтому создаем новую таблицу
+        # Подключаемся к БД и создаем таблицы
+        with closing(sqlite3.connect(DB_PATH)) as conn:
+            cursor = conn.cursor()
+            
+            # Схема уже актуальна: обычный запуск сводит инициализацию
+            # к чтению одной PRAGMA
+            if cursor.execute("PRAGMA user_version").fetchone()[0] >= CURRENT_SCHEMA_VERSION:
+                _initialized = True
+                return
+            
+            # Таблица чатов: хранит метаинформацию о каждой сессии
+            # id - уникальный идентификатор чата
+            # uuid - уникальный идентификатор чата (для сквозного логирования)
+            # title - заголовок чата (первые 50 символов запроса)
+            # created_at - время создания (автоматически)
             cursor.execute("""
-                CREATE TABLE IF NOT EXISTS chats_new (
+                CREATE TABLE IF NOT EXISTS chats (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     uuid TEXT UNIQUE NOT NULL,
                     title TEXT NOT NULL,
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP
                 )
             """)
+            
+            # Таблица сообщений: хранит все сообщения в чатах
+            # id - уникальный идентификатор сообщения
+            # chat_id - связь с таблицей chats (внешний ключ)
+            # author - автор сообщения ('user' или 'system')
+            # content - текст сообщения
+            # agent_steps - JSON с промежуточными шагами агентов (для отладки)
+            # created_at - время создания (автоматически)
             cursor.execute("""
-                INSERT INTO chats_new (id, uuid, title, created_at)
-                SELECT id, uuid, title, created_at FROM chats
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    author TEXT NOT NULL CHECK(author IN ('user', 'system')),
+                    content TEXT NOT NULL,
+                    agent_steps TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (chat_id) REFERENCES chats (id)
+                )
             """)
-            cursor.execute("DROP TABLE chats")
-            cursor.execute("ALTER TABLE chats_new RENAME TO chats")
+            
+            # Сохраняем изменения
             conn.commit()
-
+            
+            # Миграция: добавляем UUID для существующих чатов, если поле отсутствует
+            # Выполненные миграции отмечаем в PRAGMA user_version, чтобы
+            # при обычном запуске не проверять структуру таблицы заново
+            if cursor.execute("PRAGMA user_version").fetchone()[0] < 1:
+                try:
+                    cursor.execute("SELECT uuid FROM chats LIMIT 1")
+                except sqlite3.OperationalError:
+                    # Поле uuid не существует. SQLite не поддерживает ALTER COLUMN,
+                    # поэтому создаем новую таблицу с обязательным уникальным uuid
+                    # и переносим в нее чаты, генерируя UUID одним запросом
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS chats_new (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            uuid TEXT UNIQUE NOT NULL,
+                            title TEXT NOT NULL,
+                            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
+                    cursor.execute(f"""
+                        INSERT INTO chats_new (id, uuid, title, created_at)
+                        SELECT id, {_SQL_UUID4}, title, created_at FROM chats
+                    """)
+                    cursor.execute("DROP TABLE chats")
+                    cursor.execute("ALTER TABLE chats_new RENAME TO chats")
+                cursor.execute("PRAGMA user_version = 1")
+                conn.commit()
+            
+            # Индексы под запросы из database.py (создаются после миграции,
+            # т.к. она пересоздает таблицу chats):
+            # - get_messages: WHERE chat_id = ? ORDER BY created_at
+            # - get_chats: ORDER BY created_at DESC
+            # Отдельный индекс по chats.uuid не нужен: UNIQUE уже создает его
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_messages_chat_created
+                ON messages (chat_id, created_at)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_chats_created
+                ON chats (created_at DESC)
+            """)
+            
+            # Отмечаем, что схема приведена к текущей версии
+            cursor.execute(f"PRAGMA user_version = {CURRENT_SCHEMA_VERSION}")
+            conn.commit()
+        
+        _initialized = True
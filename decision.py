@@ -6,27 +6,55 @@
 для соблюдения ограничения на количество строк.
 """
 
-import streamlit as st
-from typing import TypedDict, List, Optional
+from dataclasses import dataclass, field
+from typing import List, Optional
 from config import MAX_ITERATIONS
+from agent_status import write_status
 
 
 # Определение состояния графа агентов
 # Используется для передачи данных между узлами графа
-class AgentState(TypedDict):
+# slots=True: доступ к полям - загрузка слота вместо поиска по словарю,
+# и экземпляр не хранит __dict__. Узлы по-прежнему возвращают словари
+# с обновлениями, а graph_app.invoke() - словарь итогового состояния.
+@dataclass(slots=True)
+class AgentState:
     """Состояние графа агентов, передаваемое между узлами."""
-    topic: str                          # Тема конспекта
-    file_content: Optional[str]         # Содержимое прикрепленного файла
-    drafts: List[str]                   # Список черновиков от генераторов
-    critiques: List[str]                # Замечания критика (устаревшее, для обратной совместимости)
-    critiques_by_generator: dict        # Замечания критика по генераторам: {1: [...], 2: [...], 3: [...]}
-    questions_for_user: List[str]       # Вопросы к пользователю
-    user_response: Optional[str]        # Ответ пользователя на вопросы
-    final_summary: Optional[str]        # Финальный конспект от редактора
-    iteration_count: int                # Счетчик итераций улучшения
-    drafts_to_redo: List[int]           # Номера черновиков для переделки (1, 2, 3)
-    log_filename: str                   # Имя файла лога для текущего запуска
-    chat_uuid: str                      # UUID чата для сквозного логирования
+    topic: str = ""                                     # Тема конспекта
+    file_content: Optional[str] = None                  # Содержимое прикрепленного файла
+    drafts: List[str] = field(default_factory=list)     # Список черновиков от генераторов
+    critiques: List[str] = field(default_factory=list)  # Замечания критика (устаревшее, для обратной совместимости)
+    critiques_by_generator: dict = field(default_factory=dict)  # Замечания критика по генераторам: {1: [...], 2: [...], 3: [...]}
+    questions_for_user: List[str] = field(default_factory=list)  # Вопросы к пользователю
+    user_response: Optional[str] = None                 # Ответ пользователя на вопросы
+    final_summary: Optional[str] = None                 # Финальный конспект от редактора
+    iteration_count: int = 0                            # Счетчик итераций улучшения
+    drafts_to_redo: List[int] = field(default_factory=list)  # Номера черновиков для переделки (1, 2, 3)
+    log_filename: str = ""                              # Имя файла лога для текущего запуска
+    chat_uuid: str = ""                                 # UUID чата для сквозного логирования
+    drafts_joined: str = ""                             # Черновики, склеенные критиком для редактора
+    critiques_joined: str = ""                          # Замечания, склеенные критиком для редактора
+    critiques_text_by_generator: dict = field(default_factory=dict)  # Замечания, склеенные критиком для каждого генератора
+
+
+# Таблица решений: индекс - трехбитный код состояния (см. decide_next_step),
+# значение - (следующий узел, сообщение для статуса)
+# Приоритеты: вопросы к пользователю > лимит итераций > замечания
+_ASK_USER = ("ask_user", "Требуется уточнение от пользователя.")
+_LIMIT = ("editor", f"Достигнут лимит в {MAX_ITERATIONS} итерации. Переход к редактору.")
+_REDO = ("generator", "Черновики {redo}отправлены на доработку.")
+_APPROVED = ("editor", "Черновики одобрены. Переход к редактору.")
+
+_DECISION_TABLE = (
+    _APPROVED,   # 000: нет вопросов, лимит не достигнут, замечаний нет
+    _REDO,       # 001: есть замечания
+    _LIMIT,      # 010: достигнут лимит
+    _LIMIT,      # 011: достигнут лимит, есть замечания
+    _ASK_USER,   # 100: есть вопросы
+    _ASK_USER,   # 101
+    _ASK_USER,   # 110
+    _ASK_USER,   # 111
+)
 
 
 def decide_next_step(state: AgentState) -> str:
@@ -49,33 +77,19 @@ def decide_next_step(state: AgentState) -> str:
         2. Если достигнут лимит итераций -> editor
         3. Если есть замечания -> generator (на доработку)
         4. Иначе -> editor (черновики одобрены)
-    """
-    st.session_state.status.write("Принимается решение о следующем шаге...")
     
-    # Приоритет 1: Если критик задал вопросы, ждем ответа пользователя
-    if state.get("questions_for_user"):
-        st.session_state.status.write("Требуется уточнение от пользователя.")
-        return "ask_user"
-    
-    # Приоритет 2: Если достигнут лимит итераций, переходим к редактору
-    if state.get("iteration_count", 0) >= MAX_ITERATIONS:
-        st.session_state.status.write(
-            f"Достигнут лимит в {MAX_ITERATIONS} итерации. Переход к редактору."
-        )
-        return "editor"
-    
-    # Приоритет 3: Если есть замечания, отправляем на доработку
-    drafts_to_redo = state.get("drafts_to_redo", [])
-    if state.get("critiques"):
-        if drafts_to_redo:
-            st.session_state.status.write(
-                f"Черновики {drafts_to_redo} отправлены на доработку."
-            )
-        else:
-            st.session_state.status.write("Черновики отправлены на доработку.")
-        return "generator"
+        Приоритеты закодированы в таблице _DECISION_TABLE, поэтому
+        функция делает одну запись в статус при любом исходе.
+    """
+    # Код состояния из трех битов: вопросы (4), лимит итераций (2), замечания (1)
+    code = (
+        (bool(state.questions_for_user) << 2)
+        | ((state.iteration_count >= MAX_ITERATIONS) << 1)
+        | bool(state.critiques)
+    )
+    next_node, message = _DECISION_TABLE[code]
     
-    # Приоритет 4: Если замечаний нет, черновики одобрены - к редактору
-    st.session_state.status.write("Черновики одобрены. Переход к редактору.")
-    return "editor"
-
+    # Для доработки уточняем, какие именно черновики отправлены
+    redo = f"{state.drafts_to_redo} " if state.drafts_to_redo else ""
+    write_status(message.format(redo=redo))
+    return next_node
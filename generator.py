@@ -1,158 +1,438 @@
 """
 Модуль узла генератора черновиков.
 
-Содержит функцию generator_node() для создания трех черновиков конспекта.
+Содержит асинхронную функцию generator_node() для создания трех черновиков
+конспекта; генераторы вызывают LLM параллельно.
 Генераторы поддерживают сессии чата с LLM для сохранения контекста
 в рамках одного chat_uuid и избежания перерасхода токенов.
 """
 
-import streamlit as st
-from typing import Dict, List
+import asyncio
+import hashlib
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Tuple
+from weakref import WeakValueDictionary
+import httpx
+import openai
+from cachetools import TTLCache
 from langchain_core.messages import AIMessage, HumanMessage
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential
+)
 
 from llm_setup import get_llm_for_generator, generator_prompt_template
-from agent_logging import log_agent_response
-from config import GENERATOR_STYLES
+from agent_logging import log_agent_response_async
+from agent_status import DebouncedStatus, write_progress
+from config import (
+    CHAT_SESSION_MAX_MESSAGES,
+    CHAT_SESSION_TTL,
+    CHAT_SESSIONS_MAX,
+    GENERATOR_RESULT_CACHE_SIZE,
+    GENERATOR_RESULT_CACHE_TTL,
+    GENERATOR_RETRY_ATTEMPTS,
+    GENERATOR_RETRY_MAX_WAIT,
+    GENERATOR_STREAM_PREVIEW_CHARS,
+    GENERATOR_STYLES,
+    GENERATOR_TIMEOUT,
+    STREAM_STATUS_INTERVAL
+)
 from decision import AgentState
 
 
+# Стили генераторов по номерам (1, 2, 3), строятся один раз при импорте
+_GENERATOR_STYLES_BY_NUM = {
+    int(key.removeprefix("draft_")): style
+    for key, style in GENERATOR_STYLES.items()
+}
+
+# Постоянная часть запроса на доработку черновика; к ней дописываются замечания
+_RETRY_HEADER = (
+    "Получены замечания от критика. Пожалуйста, исправь свой предыдущий ответ, "
+    "учитывая эти замечания, и верни полный обновленный текст конспекта.\n"
+    "Не добавляй никаких вступлений или комментариев, только сам текст.\n\n"
+    "Замечания:\n"
+)
+
 # Глобальное хранилище сессий чата для генераторов
-# Структура: {chat_uuid: {generator_num: [messages]}}
-_chat_sessions: Dict[str, Dict[int, List[AIMessage | HumanMessage]]] = {}
+# Ключ: (chat_uuid, generator_num), значение: последние сообщения сессии
+# Число сессий и их время жизни ограничены, чтобы память долгоживущего
+# сервера не росла с каждым новым чатом
+_chat_sessions: TTLCache[Tuple[str, int], Deque[AIMessage | HumanMessage]] = TTLCache(
+    maxsize=CHAT_SESSIONS_MAX,
+    ttl=CHAT_SESSION_TTL
+)
+
+# Временные ошибки API, после которых запрос генератора стоит повторить
+# (обрыв соединения, в том числе посреди потока, лимит запросов, 5xx)
+_TRANSIENT_ERRORS = (
+    httpx.TransportError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
 
+# Запросы к LLM, выполняющиеся прямо сейчас, и недавние ответы на доработку
+# Ключ - хэш чата, модели и сообщений: одинаковые запросы в чате (например,
+# у генераторов с совпадающим стилем) выполняются один раз, а результат
+# раздается всем. Черновики других чатов никогда не переиспользуются
+_inflight_requests: Dict[bytes, asyncio.Task] = {}
+_recent_responses: TTLCache[bytes, AIMessage] = TTLCache(
+    maxsize=GENERATOR_RESULT_CACHE_SIZE,
+    ttl=GENERATOR_RESULT_CACHE_TTL
+)
 
-def _get_chat_session(chat_uuid: str, generator_num: int) -> List:
+# Блокировки сессий чата (по тому же ключу), живут пока используются
+_session_locks: "WeakValueDictionary[Tuple[str, int], asyncio.Lock]" = WeakValueDictionary()
+
+
+def _get_chat_session(chat_uuid: str, generator_num: int) -> Deque:
     """Получает или создает сессию чата для генератора."""
-    if chat_uuid not in _chat_sessions:
-        _chat_sessions[chat_uuid] = {}
-    if generator_num not in _chat_sessions[chat_uuid]:
-        _chat_sessions[chat_uuid][generator_num] = []
-    return _chat_sessions[chat_uuid][generator_num]
+    return _chat_sessions.setdefault(
+        (chat_uuid, generator_num),
+        deque(maxlen=CHAT_SESSION_MAX_MESSAGES)
+    )
+
+
+def _drop_chat_session(chat_uuid: str, generator_num: int):
+    """Удаляет сессию чата генератора (например, после ошибки)."""
+    _chat_sessions.pop((chat_uuid, generator_num), None)
+
+
+def _append_turn(session: Deque, human_message: HumanMessage, response: AIMessage):
+    """
+    Добавляет в сессию пару запрос-ответ.
+    
+    Исходный запрос (session[0]) нужен для каждой доработки, поэтому при
+    заполнении сессии отбрасывается самая старая пара после него, а не он сам.
+    """
+    if len(session) + 2 > session.maxlen:
+        del session[1]
+        del session[1]
+    session.append(human_message)
+    session.append(response)
+
+
+def _get_session_lock(chat_uuid: str, generator_num: int) -> asyncio.Lock:
+    """
+    Возвращает блокировку сессии чата генератора.
+    
+    Один и тот же чат может обрабатываться одновременно (например, из двух
+    вкладок браузера); блокировка не дает двум запросам перемешать историю
+    одной сессии. Блокировка удаляется, когда ее никто не удерживает.
+    """
+    key = (chat_uuid, generator_num)
+    lock = _session_locks.get(key)
+    if lock is None:
+        lock = _session_locks[key] = asyncio.Lock()
+    return lock
 
 
 def _cleanup_chat_sessions():
-    """Очищает старые сессии чата для предотвращения утечек памяти."""
-    global _chat_sessions
-    # TODO: Реализовать очистку старых сессий по таймауту
-    # Пока оставляем как есть для MVP
+    """Удаляет сессии чата с истекшим временем жизни."""
+    # TTLCache удаляет устаревшие записи только при обращении к ним
+    _chat_sessions.expire()
 
 
-def generator_node(state: AgentState) -> dict:
+async def _stream_response(llm, messages: list, gen_num: int) -> AIMessage:
     """
-    Узел генератора: создает или обновляет черновики конспекта.
+    Получает ответ LLM потоком, показывая в статусе хвост текста.
+    
+    Строка прогресса генератора обновляется не чаще STREAM_STATUS_INTERVAL,
+    а по завершении (в том числе с ошибкой) убирается.
     
     Args:
-        state: Текущее состояние графа.
+        llm: Экземпляр LLM генератора
+        messages: Сообщения для отправки
+        gen_num: Номер генератора
     
     Returns:
-        dict: Обновленное состояние с новыми черновиками и счетчиком итераций.
+        AIMessage: Полный ответ, собранный из фрагментов
     """
-    st.session_state.status.write("Генераторы готовят черновики...")
-    
-    chat_uuid = state["chat_uuid"]
-    iteration = state.get("iteration_count", 0) + 1
-    
-    drafts_to_redo = state.get("drafts_to_redo", [])
-    if not drafts_to_redo or iteration == 1:
-        drafts_to_redo = [1, 2, 3]
-        st.session_state.status.write("Генераторы создают черновики...")
-    else:
-        st.session_state.status.write(f"Генераторы дорабатывают черновики: {drafts_to_redo}")
-
-    # Нормализуем список черновиков до фиксированной длины 3
-    drafts_state = state.get("drafts")
-    if not drafts_state:
-        new_drafts = ["", "", ""]
-    elif len(drafts_state) < 3:
-        new_drafts = (drafts_state + ["", "", ""])[:3]
-    else:
-        new_drafts = drafts_state[:]  # Копируем, чтобы изменять
-
-    # Обрабатываем каждый генератор, который требует доработки
-    for gen_num in drafts_to_redo:
-        st.session_state.status.write(f"Генератор {gen_num} работает...")
-        
-        # Защита от некорректных номеров генераторов
-        if not (1 <= gen_num <= len(new_drafts)):
-            st.session_state.status.write(f"Пропуск генератора {gen_num}: некорректный номер")
-            continue
-        
+    progress_key = f"generator_{gen_num}"
+    chunks = []
+    last_update = time.monotonic()
+    try:
+        async for chunk in llm.astream(messages):
+            chunks.append(chunk.content)
+            now = time.monotonic()
+            if now - last_update >= STREAM_STATUS_INTERVAL:
+                preview = "".join(chunks[-50:])[-GENERATOR_STREAM_PREVIEW_CHARS:]
+                write_progress(progress_key, f"Генератор {gen_num}: ...{preview}")
+                last_update = now
+    finally:
+        write_progress(progress_key, None)
+    return AIMessage(content="".join(chunks))
+
+
+async def _generate_with_retry(llm, messages: list, gen_num: int) -> AIMessage:
+    """
+    Вызывает генератор, повторяя запрос при временных ошибках API.
+    
+    Между попытками выдерживается экспоненциальная пауза со случайным
+    разбросом. Сессия генератора при этом не сбрасывается: повтор
+    отправляет те же сообщения, и провайдер может использовать кэш префикса.
+    
+    Args:
+        llm: Экземпляр LLM генератора
+        messages: Сообщения для отправки
+        gen_num: Номер генератора
+    
+    Returns:
+        AIMessage: Ответ генератора
+    
+    Raises:
+        Exception: Последняя ошибка, если все попытки исчерпаны
+    """
+    progress_key = f"generator_{gen_num}"
+    retrying = AsyncRetrying(
+        stop=stop_after_attempt(GENERATOR_RETRY_ATTEMPTS),
+        wait=wait_random_exponential(min=1, max=GENERATOR_RETRY_MAX_WAIT),
+        retry=retry_if_exception_type(_TRANSIENT_ERRORS),
+        before_sleep=lambda retry_state: write_progress(
+            progress_key,
+            f"Генератор {gen_num}: повтор запроса "
+            f"({retry_state.attempt_number + 1}/{GENERATOR_RETRY_ATTEMPTS})..."
+        ),
+        reraise=True,
+    )
+    async for attempt in retrying:
+        with attempt:
+            return await _stream_response(llm, messages, gen_num)
+
+
+def _request_key(chat_uuid: str, llm, messages: list) -> bytes:
+    """Вычисляет ключ запроса к LLM по чату, модели и содержимому сообщений."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(chat_uuid.encode() + b"\0")
+    digest.update(str(getattr(llm, "model_name", "")).encode())
+    for message in messages:
+        digest.update(b"\0" + message.type.encode() + b"\0")
+        digest.update(message.content.encode())
+    return digest.digest()
+
+
+async def _single_flight(
+    key: bytes,
+    request: Callable[[], Awaitable[AIMessage]],
+    cache_result: bool
+) -> AIMessage:
+    """
+    Выполняет запрос к LLM один раз для всех одновременных одинаковых запросов.
+    
+    Если такой же запрос уже выполняется, ожидает его результат; если он
+    недавно завершился успешно (GENERATOR_RESULT_CACHE_TTL) и был сохранен,
+    возвращает сохраненный ответ. Ошибки не кэшируются.
+    
+    Args:
+        key: Ключ запроса (см. _request_key())
+        request: Функция, создающая корутину запроса
+        cache_result: Сохранить ли ответ для повторных запросов. Только для
+            доработки: первый черновик генерируется с температурой > 0,
+            и повторный запрос темы должен давать новый текст
+    
+    Returns:
+        AIMessage: Ответ LLM
+    """
+    response = _recent_responses.get(key)
+    if response is not None:
+        return response
+    
+    task = _inflight_requests.get(key)
+    if task is None:
+        task = asyncio.ensure_future(request())
+        _inflight_requests[key] = task
+        task.add_done_callback(lambda _: _inflight_requests.pop(key, None))
+    
+    # shield: отмена одного ожидающего не отменяет запрос для остальных
+    response = await asyncio.shield(task)
+    if cache_result:
+        _recent_responses[key] = response
+    return response
+
+
+async def _run_one(
+    gen_num: int,
+    state: AgentState,
+    iteration: int,
+    old_draft: str,
+    shared_input: dict,
+    status: DebouncedStatus
+) -> str:
+    """
+    Запускает один генератор и возвращает его черновик.
+    
+    При ошибке или превышении GENERATOR_TIMEOUT возвращает прежний
+    черновик и сбрасывает сессию генератора, чтобы не сломать флоу.
+    
+    Args:
+        gen_num: Номер генератора (1, 2 или 3)
+        state: Текущее состояние графа
+        iteration: Номер текущей итерации
+        old_draft: Черновик генератора с прошлой итерации
+        shared_input: Общие для всех генераторов параметры шаблона промпта
+        status: Статус узла для сообщений о ходе работы
+    
+    Returns:
+        str: Новый (или прежний, при ошибке) черновик
+    """
+    chat_uuid = state.chat_uuid
+    # Сессия генератора изменяется только под ее блокировкой
+    async with _get_session_lock(chat_uuid, gen_num):
         session = _get_chat_session(chat_uuid, gen_num)
         llm = get_llm_for_generator(gen_num)
-        key = f"draft_{gen_num}"
-        style = GENERATOR_STYLES[key]
-
+        style = _GENERATOR_STYLES_BY_NUM[gen_num]
+        
         is_first_call = not session
-
+        
         if is_first_call:
             # Первый вызов: создаем черновик с нуля
-            prompt_input = {
-                "topic": state["topic"],
-                "style_description": style,
-                "file_content": state.get("file_content", "Нет"),
-                "critiques": "Нет замечаний.",
-                "user_response": state.get("user_response", "Нет"),
-            }
-            human_message = HumanMessage(content=generator_prompt_template.format(**prompt_input))
+            human_message = HumanMessage(
+                content=generator_prompt_template().format(
+                    style_description=style,
+                    **shared_input
+                )
+            )
             messages_to_send = [human_message]
         else:
             # Последующие вызовы: отправляем замечания для исправления
-            critiques = state.get("critiques_by_generator", {}).get(gen_num, [])
-            critiques_text = "\n".join(critiques)
+            # Текст замечаний уже склеен критиком
+            critiques_text = state.critiques_text_by_generator.get(gen_num, "")
             
-            content = (
-                "Получены замечания от критика. Пожалуйста, исправь свой предыдущий ответ, "
-                "учитывая эти замечания, и верни полный обновленный текст конспекта.\n"
-                "Не добавляй никаких вступлений или комментариев, только сам текст.\n\n"
-                f"Замечания:\n{critiques_text}"
-            )
-            human_message = HumanMessage(content=content)
-            # Отправляем всю историю + новый запрос
-            messages_to_send = session + [human_message]
-
+            human_message = HumanMessage(content=_RETRY_HEADER + critiques_text)
+            # Отправляем исходный запрос, последний черновик и новые замечания:
+            # замечания относятся только к последнему ответу, а вся история
+            # лишь увеличивала бы промпт с каждой итерацией
+            messages_to_send = [session[0], session[-1], human_message]
+        
         try:
-            # Вызов LLM с полной историей сообщений
-            response = llm.invoke(messages_to_send)
+            # Вызов LLM (ответ принимается потоком, временные ошибки повторяются)
+            # Генераторы работают параллельно, поэтому ограничиваем время ожидания
+            # всех попыток вместе; одинаковые запросы выполняются один раз
+            response = await _single_flight(
+                _request_key(chat_uuid, llm, messages_to_send),
+                lambda: asyncio.wait_for(
+                    _generate_with_retry(llm, messages_to_send, gen_num),
+                    timeout=GENERATOR_TIMEOUT
+                ),
+                cache_result=not is_first_call
+            )
             new_draft = response.content
             
             # Обновляем сессию
-            session.append(messages_to_send[-1]) # human_message
-            session.append(response) # AIMessage
-
+            _append_turn(session, messages_to_send[-1], response)
+            # Повторная запись продлевает время жизни активной сессии
+            _chat_sessions[(chat_uuid, gen_num)] = session
+        
+        except asyncio.TimeoutError:
+            status.write(f"Генератор {gen_num} не ответил за {GENERATOR_TIMEOUT} с.", force=True)
+            new_draft = old_draft
+            _drop_chat_session(chat_uuid, gen_num)
+        
         except Exception as e:
-            st.session_state.status.write(f"Ошибка у Генератора {gen_num}: {e}")
-            # В случае ошибки, чтобы не сломать флоу, возвращаем старый черновик
-            new_draft = new_drafts[gen_num - 1]
-            if chat_uuid in _chat_sessions and gen_num in _chat_sessions[chat_uuid]:
-                del _chat_sessions[chat_uuid][gen_num] # Сбрасываем сессию при ошибке
-
-        # Сохраняем результат
-        new_drafts[gen_num - 1] = new_draft
-
+            status.write(f"Ошибка у Генератора {gen_num}: {e}", force=True)
+            # Попытки исчерпаны или ошибка не временная: чтобы не сломать флоу,
+            # возвращаем старый черновик
+            new_draft = old_draft
+            _drop_chat_session(chat_uuid, gen_num) # Сбрасываем сессию при ошибке
+        
         # Логирование
-        log_agent_response(
+        log_agent_response_async(
             agent_type=f"generator_{gen_num}",
-            log_filename=state["log_filename"],
-            topic=state["topic"],
+            log_filename=state.log_filename,
+            topic=state.topic,
             iteration=iteration,
             response=new_draft,
             chat_uuid=chat_uuid,
             metadata={
                 "style": style,
-                "has_file_content": bool(state.get("file_content")) and is_first_call,
+                "has_file_content": bool(state.file_content) and is_first_call,
                 "has_critiques": not is_first_call,
                 "redone": True,
                 "session_length": len(session),
             },
         )
-        st.session_state.status.write(f"Генератор {gen_num} завершил работу.")
+        status.write(f"Генератор {gen_num} завершил работу.")
+        return new_draft
+
 
-    st.session_state.status.write("Все генераторы завершили работу.")
-    _cleanup_chat_sessions()
+async def generator_node(state: AgentState) -> dict:
+    """
+    Узел генератора: создает или обновляет черновики конспекта.
+    
+    Генераторы, которым нужно создать или доработать черновик,
+    вызывают LLM параллельно (asyncio.gather), поэтому время узла
+    определяется самым медленным генератором, а не суммой.
     
-    return {
-        "drafts": new_drafts,
-        "user_response": None,
-        "iteration_count": iteration,
-        "drafts_to_redo": [],
-    }
+    Args:
+        state: Текущее состояние графа.
+    
+    Returns:
+        dict: Обновленное состояние с новыми черновиками и счетчиком итераций.
+    """
+    with DebouncedStatus() as status:
+        status.write("Генераторы готовят черновики...")
+        
+        iteration = state.iteration_count + 1
+        
+        drafts_to_redo = state.drafts_to_redo
+        if not drafts_to_redo or iteration == 1:
+            drafts_to_redo = [1, 2, 3]
+            status.write("Генераторы создают черновики...")
+        else:
+            status.write(f"Генераторы дорабатывают черновики: {drafts_to_redo}")
+        
+        # Нормализуем список черновиков до фиксированной длины 3
+        drafts_state = state.drafts
+        if not drafts_state:
+            new_drafts = ["", "", ""]
+        elif len(drafts_state) < 3:
+            new_drafts = (drafts_state + ["", "", ""])[:3]
+        else:
+            new_drafts = drafts_state[:]  # Копируем, чтобы изменять
+        
+        # Отбираем генераторы для запуска (без повторов, в исходном порядке)
+        gen_nums = []
+        for gen_num in dict.fromkeys(drafts_to_redo):
+            # Защита от некорректных номеров генераторов
+            if not (1 <= gen_num <= len(new_drafts)):
+                status.write(f"Пропуск генератора {gen_num}: некорректный номер", force=True)
+                continue
+            gen_nums.append(gen_num)
+        
+        # Общие параметры промпта первого вызова собираются один раз на узел,
+        # генераторы добавляют к ним только свой стиль
+        shared_input = {
+            "topic": state.topic,
+            "file_content": state.file_content,
+            "critiques": "Нет замечаний.",
+            "user_response": state.user_response,
+        }
+        
+        status.write(f"Генераторы {gen_nums} работают...")
+        # return_exceptions: сбой одного генератора не отменяет остальные
+        results = await asyncio.gather(*(
+            _run_one(gen_num, state, iteration, new_drafts[gen_num - 1], shared_input, status)
+            for gen_num in gen_nums
+        ), return_exceptions=True)
+        
+        # Сохраняем результаты
+        for gen_num, result in zip(gen_nums, results):
+            if isinstance(result, Exception):
+                # Например, не задан API ключ генератора - оставляем старый черновик
+                status.write(f"Ошибка у Генератора {gen_num}: {result}", force=True)
+                continue
+            new_drafts[gen_num - 1] = result
+        
+        status.write("Все генераторы завершили работу.")
+        _cleanup_chat_sessions()
+        
+        return {
+            "drafts": new_drafts,
+            "user_response": None,
+            "iteration_count": iteration,
+            "drafts_to_redo": [],
+        }
@@ -7,16 +7,33 @@
 
 Граф автоматически управляет потоком данных между узлами
 и принимает решения о следующем шаге на основе состояния.
+
+Узлы графа асинхронные, поэтому граф запускается через run_graph(),
+который выполняет graph_app.ainvoke() в фоновом цикле событий.
+Состояние графа сохраняется чекпойнтером, пока ожидается ответ
+пользователя на уточняющие вопросы.
 """
 
+import queue
+import threading
 import streamlit as st
+from cachetools import TTLCache
+from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.graph import StateGraph, END
 
 # Импортируем узлы через модуль-обертку agents.py
 from agents import prompter_node, generator_node, critic_node, editor_node
 from decision import AgentState, decide_next_step
 from prompter import decide_after_prompter
-from config import GRAPH_RECURSION_LIMIT
+from config import (
+    GRAPH_MAX_CONCURRENCY,
+    GRAPH_RECURSION_LIMIT,
+    PAUSED_GRAPHS_MAX,
+    PAUSED_GRAPH_TTL
+)
+from async_runtime import run_async
+from agent_status import bind_status_queue, drain_status_queue
+from agent_logging import sync_logs
 
 
 @st.cache_resource
@@ -88,10 +105,124 @@ def build_graph():
     workflow.add_edge("editor", END)
     
     # Компилируем граф для использования
-    return workflow.compile()
+    # Чекпойнтер хранит состояние графа по чатам (thread_id = UUID чата),
+    # поэтому для продолжения диалога достаточно передать ответ пользователя
+    return workflow.compile(checkpointer=InMemorySaver())
 
 
 # Создаем глобальный экземпляр графа
 # Граф кэшируется благодаря @st.cache_resource
 graph_app = build_graph()
 
+
+class _PausedThreads(TTLCache):
+    """
+    Чаты, в которых граф приостановлен в ожидании ответа пользователя.
+    
+    Чекпойнтер хранит состояния в памяти процесса, а пользователь может
+    не ответить на вопросы и перейти в другой чат. Поэтому число
+    приостановленных потоков ограничено (PAUSED_GRAPHS_MAX), а время
+    ожидания - PAUSED_GRAPH_TTL: вытесненные и устаревшие потоки
+    удаляются из чекпойнтера.
+    """
+    
+    def popitem(self):
+        thread_id, value = super().popitem()
+        graph_app.checkpointer.delete_thread(thread_id)
+        return thread_id, value
+    
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for thread_id, _ in expired:
+            graph_app.checkpointer.delete_thread(thread_id)
+        return expired
+
+
+# Приостановленные потоки графа: {thread_id (UUID чата): True}
+# Доступ - из потока скрипта (has_saved_state) и из цикла событий (run_graph)
+_paused_threads = _PausedThreads(maxsize=PAUSED_GRAPHS_MAX, ttl=PAUSED_GRAPH_TTL)
+_paused_lock = threading.Lock()
+
+
+def _thread_config(thread_id: str) -> dict:
+    """Возвращает конфигурацию запуска графа для потока (чата) thread_id."""
+    return {
+        "recursion_limit": GRAPH_RECURSION_LIMIT,
+        "max_concurrency": GRAPH_MAX_CONCURRENCY,
+        "configurable": {"thread_id": thread_id},
+    }
+
+
+def has_saved_state(thread_id: str) -> bool:
+    """
+    Проверяет, сохранено ли состояние графа для чата.
+    
+    Args:
+        thread_id: UUID чата
+    
+    Returns:
+        bool: True, если граф ожидает ответа пользователя в этом чате
+    """
+    with _paused_lock:
+        return thread_id in _paused_threads
+
+
+def run_graph(graph_input: dict, thread_id: str, resume: bool = False) -> dict:
+    """
+    Запускает граф агентов и дожидается итогового состояния.
+    
+    Граф выполняется в фоновом цикле событий, а сообщения статуса
+    от узлов выводятся в UI из вызывающего потока (потока скрипта Streamlit)
+    по мере их появления.
+    
+    Новый запрос (resume=False) начинается с чистого состояния. При
+    продолжении (resume=True) graph_input содержит только изменившиеся поля
+    (ответ пользователя), остальное берется из сохраненного состояния.
+    Сохраненное состояние удаляется, как только граф завершил работу
+    без вопросов к пользователю или с ошибкой; ожидающее ответа
+    состояние хранится не дольше PAUSED_GRAPH_TTL (см. _PausedThreads). После запуска записи лога агентов
+    сбрасываются на диск.
+    
+    Args:
+        graph_input: Начальное состояние графа или обновление сохраненного
+        thread_id: UUID чата, по которому сохраняется состояние
+        resume: Продолжить ли работу с сохраненного состояния
+    
+    Returns:
+        dict: Итоговое состояние графа
+    """
+    status_queue = queue.SimpleQueue()
+    progress_lines = {}
+    config = _thread_config(thread_id)
+    checkpointer = graph_app.checkpointer
+    
+    async def _run():
+        bind_status_queue(status_queue)
+        with _paused_lock:
+            # Удаляем состояния чатов, где ответа так и не дождались
+            _paused_threads.expire()
+        if not resume:
+            await checkpointer.adelete_thread(thread_id)
+        paused = False
+        try:
+            final_state = await graph_app.ainvoke(graph_input, config=config)
+            paused = bool(final_state.get("questions_for_user"))
+        finally:
+            with _paused_lock:
+                if paused:
+                    _paused_threads[thread_id] = True
+                else:
+                    _paused_threads.pop(thread_id, None)
+            if not paused:
+                # Ответ пользователя больше не ожидается (или запуск упал) -
+                # состояние не нужно
+                await checkpointer.adelete_thread(thread_id)
+        return final_state
+    
+    final_state = run_async(
+        _run(),
+        on_wait=lambda: drain_status_queue(status_queue, progress_lines)
+    )
+    # Записи лога этого запуска сбрасываем на диск сразу
+    sync_logs()
+    return final_state
@@ -4,42 +4,78 @@
 Содержит функции для:
 - Создания экземпляров LLM с различными настройками
 - Загрузки промптов из файлов
-- Создания шаблонов промптов для агентов
+- Создания шаблонов промптов для агентов (лениво, при первом обращении)
+- Очистки ответов LLM от обрамления markdown код-блоком
 
 Использует LangChain для работы с LLM и промптами.
 """
 
 import os
-import streamlit as st
+import re
+from functools import cache
+from pathlib import Path
+import httpx
 from langchain_openai import ChatOpenAI
+from langchain_core.caches import InMemoryCache
 from langchain_core.prompts import ChatPromptTemplate
 from config import (
     DEFAULT_API_KEY,
     DEFAULT_BASE_URL,
     DEFAULT_MODEL,
     DEFAULT_TEMPERATURE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_TIMEOUT,
+    PROMPTER_CACHE_SIZE,
+    PROMPTER_MAX_TOKENS,
+    PROMPTER_MODEL,
+    PROMPTER_TEMPERATURE,
     PROMPTS_DIR
 )
 
+# HTTP/2 требует пакет h2 (httpx[http2]); без него клиент работает по HTTP/1.1
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
 
-@st.cache_resource
-def get_llm():
+
+@cache
+def get_http_async_client() -> httpx.AsyncClient:
     """
-    Создает и кэширует экземпляр LLM для основных операций.
+    Создает и кэширует общий асинхронный HTTP-клиент для всех LLM.
     
-    Использует декоратор @st.cache_resource для кэширования
-    экземпляра между перезапусками приложения Streamlit.
-    Это повышает производительность и снижает количество API вызовов.
+    Все экземпляры ChatOpenAI (основной и три генератора) используют
+    один пул соединений: по HTTP/2 параллельные запросы генераторов идут
+    потоками одного TLS-соединения, а соединение переиспользуется
+    между итерациями.
+    
+    Клиент привязан к циклу событий, в котором впервые используется, -
+    к фоновому циклу (см. async_runtime.py), который живет все время
+    работы процесса. Поэтому клиент создается лениво, из фабрик LLM
+    в этом цикле, и кэшируется на уровень процесса (functools.cache),
+    а не в кэше ресурсов Streamlit, недоступном вне потока скрипта.
     
     Returns:
-        ChatOpenAI: Настроенный экземпляр LLM для работы с Deepseek API
+        httpx.AsyncClient: Общий HTTP-клиент
+    """
+    return httpx.AsyncClient(
+        http2=_HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS
+        ),
+    )
+
+
+def _get_default_api_key() -> str:
+    """
+    Возвращает API ключ по умолчанию для основных LLM.
     
     Raises:
         ValueError: Если API ключ не установлен ни в переменных окружения, ни в конфигурации
-    
-    Note:
-        API ключ и другие настройки берутся из переменных окружения
-        или конфигурации по умолчанию.
     """
     # Пытаемся получить ключ из конфигурации или напрямую из окружения
     api_key = DEFAULT_API_KEY or os.getenv("OPENAI_API_KEY")
@@ -51,23 +87,85 @@ def get_llm():
             "- OPENAI_API_KEY (fallback)\n\n"
             "Для Docker: добавьте переменную в docker-compose.yml или создайте .env файл"
         )
+    return api_key
+
+
+@cache
+def get_llm():
+    """
+    Создает и кэширует экземпляр LLM для основных операций.
+    
+    Экземпляр кэшируется на уровень процесса (functools.cache) и
+    переживает перезапуски скрипта Streamlit. st.cache_resource здесь
+    не подходит: узлы графа вызывают фабрику в фоновом цикле событий
+    (см. async_runtime.py), где нет контекста сессии Streamlit, и
+    при промахе кэша его индикатор загрузки падает с NoSessionContext.
+    
+    Returns:
+        ChatOpenAI: Настроенный экземпляр LLM для работы с Deepseek API
     
+    Raises:
+        ValueError: Если API ключ не установлен ни в переменных окружения, ни в конфигурации
+    
+    Note:
+        API ключ и другие настройки берутся из переменных окружения
+        или конфигурации по умолчанию.
+    """
     return ChatOpenAI(
-        api_key=api_key,
+        api_key=_get_default_api_key(),
         base_url=DEFAULT_BASE_URL,
         model=DEFAULT_MODEL,
         temperature=DEFAULT_TEMPERATURE,
+        http_async_client=get_http_async_client(),
     )
 
 
+@cache
+def get_prompter_llm():
+    """
+    Создает и кэширует экземпляр LLM для Prompter-а.
+    
+    Prompter только проверяет и уточняет запрос, поэтому работает
+    на отдельно настраиваемой (быстрой) модели PROMPTER_MODEL,
+    с нулевой температурой и кэшем ответов: на одинаковый промпт
+    ответ детерминирован, и повторный запрос не уходит в API.
+    Кэш хранится в памяти процесса и ограничен PROMPTER_CACHE_SIZE.
+    Экземпляр кэшируется на уровень процесса, как в get_llm(): фабрика
+    вызывается из узла Prompter-а в фоновом цикле событий.
+    Длина ответа ограничена PROMPTER_MAX_TOKENS: некорректный ответ
+    не может генерироваться неограниченно долго.
+    
+    Returns:
+        ChatOpenAI: Настроенный экземпляр LLM для Prompter-а
+    
+    Raises:
+        ValueError: Если API ключ не установлен
+    """
+    return ChatOpenAI(
+        api_key=_get_default_api_key(),
+        base_url=DEFAULT_BASE_URL,
+        model=PROMPTER_MODEL,
+        temperature=PROMPTER_TEMPERATURE,
+        max_tokens=PROMPTER_MAX_TOKENS,
+        cache=InMemoryCache(maxsize=PROMPTER_CACHE_SIZE),
+        http_async_client=get_http_async_client(),
+    )
+
+
+@cache
 def get_llm_for_generator(generator_num: int) -> ChatOpenAI:
     """
-    Создает экземпляр LLM для конкретного генератора.
+    Создает и кэширует экземпляр LLM для конкретного генератора.
     
     Позволяет использовать разные API ключи для разных генераторов,
     что может быть полезно для распределения нагрузки или использования
     разных моделей для разных стилей генерации.
     
+    Экземпляр кэшируется по номеру генератора на уровень процесса, как
+    в get_llm(), поэтому HTTP-клиент и его пул соединений переиспользуются
+    между итерациями, а не создаются заново на каждый вызов. Фабрика
+    вызывается только из узла генератора в фоновом цикле событий.
+    
     Args:
         generator_num: Номер генератора (1, 2 или 3)
     
@@ -112,6 +210,10 @@ def get_llm_for_generator(generator_num: int) -> ChatOpenAI:
         base_url=base_url,
         model=model,
         temperature=DEFAULT_TEMPERATURE,
+        # Временные ошибки повторяет generator._generate_with_retry;
+        # собственные повторы SDK openai отключены, чтобы попытки не умножались
+        max_retries=0,
+        http_async_client=get_http_async_client(),
     )
 
 
@@ -137,28 +239,67 @@ def load_prompt(filename: str) -> str:
         >>> print(prompt[:50])
         Твоя роль - эксперт-писатель...
     """
-    prompt_path = os.path.join(PROMPTS_DIR, filename)
-    with open(prompt_path, "r", encoding="utf-8") as f:
-        return f.read()
+    return Path(PROMPTS_DIR, filename).read_text(encoding="utf-8")
+
+
+# Обрамление markdown код-блока (```json ... ```) вокруг JSON-ответа LLM
+# Компилируется один раз; sub() удаляет префикс и суффикс за один проход
+_FENCE_RE = re.compile(r'\A\s*```(?:json)?\s*|\s*```\s*\Z', re.IGNORECASE)
+
+
+def strip_code_fence(text: str) -> str:
+    """
+    Удаляет обрамление markdown код-блока вокруг ответа LLM.
+    
+    В отличие от lstrip('```json'), который удаляет набор символов,
+    а не префикс, не затрагивает начало и конец самого JSON.
+    
+    Args:
+        text: Ответ LLM, возможно обернутый в ```json ... ```
+    
+    Returns:
+        str: Текст без обрамления
+    
+    Example:
+        >>> strip_code_fence('```json\n{"a": 1}\n```')
+        '{"a": 1}'
+    """
+    return _FENCE_RE.sub('', text)
 
 
 # --- СОЗДАНИЕ ШАБЛОНОВ ПРОМПТОВ ---
+# Шаблоны создаются лениво, при первом обращении, и кэшируются: импорт
+# модуля не читает файлы промптов, а разбираются только нужные шаблоны
 
-# Шаблон промпта для генераторов черновиков
-# Используется всеми тремя генераторами с разными стилями
-generator_prompt_template = ChatPromptTemplate.from_template(
-    load_prompt("generator.txt")
-)
 
-# Шаблон промпта для критика
-# Критик анализирует три черновика и выносит вердикт
-critic_prompt_template = ChatPromptTemplate.from_template(
-    load_prompt("critic.txt")
-)
+@cache
+def generator_prompt_template() -> ChatPromptTemplate:
+    """
+    Возвращает шаблон промпта для генераторов черновиков.
+    
+    Используется всеми тремя генераторами с разными стилями.
+    Общая часть (тема и контекст из файла) идет в начале промпта, а стиль,
+    замечания и ответ пользователя - в конце: кэш промптов провайдера
+    (Deepseek/OpenAI) совпадает только по префиксу.
+    """
+    return ChatPromptTemplate.from_template(load_prompt("generator.txt"))
 
-# Шаблон промпта для редактора
-# Редактор собирает финальный конспект из черновиков и замечаний критика
-editor_prompt_template = ChatPromptTemplate.from_template(
-    load_prompt("editor.txt")
-)
 
+@cache
+def critic_prompt_template() -> ChatPromptTemplate:
+    """
+    Возвращает шаблон промпта для критика.
+    
+    Критик анализирует три черновика и выносит вердикт.
+    """
+    return ChatPromptTemplate.from_template(load_prompt("critic.txt"))
+
+
+@cache
+def editor_prompt_template() -> ChatPromptTemplate:
+    """
+    Возвращает шаблон промпта для редактора.
+    
+    Редактор собирает финальный конспект из черновиков и замечаний критика.
+    """
+    return ChatPromptTemplate.from_template(load_prompt("editor.txt"))
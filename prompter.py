@@ -1,80 +1,196 @@
 """
 Модуль узла "Prompter".
 
-Содержит узел `prompter_node` для анализа и улучшения
+Содержит асинхронный узел `prompter_node` для анализа и улучшения
 пользовательского запроса перед передачей его генераторам.
 """
 
-import json
-import streamlit as st
+import re
+from functools import cache
+from typing import List, Literal, Optional
 from langchain_core.prompts import ChatPromptTemplate
-from llm_setup import get_llm, load_prompt
+from pydantic import BaseModel
+from llm_setup import get_prompter_llm, load_prompt
 from decision import AgentState
-from agent_logging import log_agent_response
+from agent_logging import log_agent_response_async
+from agent_status import DeferredStatus
+from config import PROMPTER_SKIP_MIN_WORDS
 
 
-# Загружаем шаблон промпта для Prompter-а
-prompter_prompt_template = ChatPromptTemplate.from_template(
-    load_prompt("prompter.txt")
+class PromptAnalysis(BaseModel):
+    """Результат анализа запроса Prompter-ом (схема JSON-ответа LLM)."""
+    prompt_is_valid: bool                        # Соответствует ли запрос стандарту
+    prepared_prompt: Optional[str] = None        # Исходный или дополненный текст промпта
+    clarification_questions: List[str] = []      # Уточняющие вопросы к пользователю
+
+
+# Блок с предыдущими вопросами и ответом пользователя; добавляется в промпт
+# только если вопросы были, а не передается как "Нет"/"None"
+_CLARIFICATION_TEMPLATE = (
+    "\nПредыдущие вопросы к пользователю и его ответы:\n\n"
+    "---\n"
+    "Вопросы: {questions}\n"
+    "Ответ: {user_response}\n"
+    "---\n"
 )
 
+# Однозначные ответы на уточняющий вопрос (без учета регистра и знаков в конце)
+_YES_NO_ANSWERS = frozenset({"да", "нет", "yes", "no"})
 
-def prompter_node(state: AgentState) -> dict:
-    """
-    Узел Prompter: анализирует и при необходимости уточняет запрос пользователя.
+
+def _is_yes_no(user_response: Optional[str]) -> bool:
+    """Проверяет, что ответ пользователя - просто "да" или "нет"."""
+    return bool(user_response) and user_response.strip().rstrip("!.").lower() in _YES_NO_ANSWERS
+
+
+# Явные признаки пунктов стандарта промпта (см. prompter_system.txt):
+# роль - только "Ты - <кто>" (с тире) или "Представь, что ты..." в начале
+# предложения (а не "..., ты - молодец");
+# контекст - устойчивые обороты вроде "я готовлюсь", "мне нужно", "для экзамена";
+# задача - глагол-поручение или слово "конспект"
+_ROLE_RE = re.compile(
+    r'(?:^|[.!?]\s*)(?:ты\s*[-—–]\s*\w+|представь,?\s+что\s+ты\b)',
+    re.IGNORECASE | re.MULTILINE
+)
+_CONTEXT_RE = re.compile(
+    r'\b(?:я\s+(?:готовлюсь|учусь|изучаю|работаю|преподаю|студент\w*|школьни\w*)'
+    r'|мне\s+(?:нужно|надо|поручили|предстоит)'
+    r'|руководство\s+поручило'
+    r'|для\s+(?:подготовки|экзамена|собеседования|студентов|школьников|новичков'
+    r'|начинающих|команды|курса|урока|лекции))\b',
+    re.IGNORECASE
+)
+_TASK_RE = re.compile(r'\b(составь|напиши|подготовь|сделай|опиши|объясни|конспект\w*)\b', re.IGNORECASE)
+
+
+def _looks_well_formed(prompt: str) -> bool:
     """
-    st.session_state.status.write("Анализ запроса...")
-    
-    llm = get_llm()
-    chain = prompter_prompt_template | llm
+    Проверяет, что в запросе явно есть роль, контекст и задача.
     
-    # Если есть `user_response`, значит, это ответ на уточняющий вопрос
-    prompt = state["topic"]
-    questions = state.get("questions_for_user", [])
-    user_response = state.get("user_response", "Нет")
+    Такой запрос LLM почти наверняка признает соответствующим стандарту,
+    поэтому его можно передать генераторам без анализа.
     
-    response = chain.invoke({
-        "prompt": prompt,
-        "questions": "\n".join(questions) if questions else "Нет",
-        "user_response": user_response
-    })
-    
-    # Логируем ответ промптера
-    log_agent_response(
-        agent_type="prompter",
-        log_filename=state["log_filename"],
-        topic=state["topic"],
-        iteration=0,  # Prompter - это нулевая итерация
-        response=response.content,
-        chat_uuid=state["chat_uuid"],
-        metadata={}
+    Example:
+        >>> _looks_well_formed("Ты - опытный историк. Я готовлюсь к экзамену. "
+        ...                    "Составь конспект про Пунические войны.")
+        True
+        >>> _looks_well_formed("Представь, что ты учитель. Мне нужно составить конспект по физике")
+        True
+        >>> _looks_well_formed("Напиши конспект про Python для новичков, ты - молодец")
+        False
+        >>> _looks_well_formed("Напиши конспект для школьников про тыкву и тысячу лет")
+        False
+        >>> _looks_well_formed("Объясни, что ты знаешь про Рим, я не понял ничего")
+        False
+        >>> _looks_well_formed("расскажи про питон")
+        False
+    """
+    return (
+        len(prompt.split()) >= PROMPTER_SKIP_MIN_WORDS
+        and _ROLE_RE.search(prompt) is not None
+        and _CONTEXT_RE.search(prompt) is not None
+        and _TASK_RE.search(prompt) is not None
     )
+
+
+@cache
+def prompter_prompt_template() -> ChatPromptTemplate:
+    """
+    Возвращает шаблон промпта для Prompter-а (загружается при первом обращении).
     
-    try:
-        cleaned_response = response.content.strip().lstrip('```json').lstrip('```').rstrip('```')
-        result = json.loads(cleaned_response)
+    Неизменные инструкции вынесены в системное сообщение - оно одинаково
+    во всех запросах и попадает в кэш префикса провайдера, а в сообщении
+    пользователя остаются только переменные части.
+    """
+    return ChatPromptTemplate.from_messages([
+        ("system", load_prompt("prompter_system.txt")),
+        ("human", load_prompt("prompter_user.txt")),
+    ])
+
+
+# Цепочка "промпт | LLM" собирается один раз при первом вызове узла
+_prompter_chain = None
+
+
+def _get_prompter_chain():
+    """Возвращает закэшированную цепочку промпта Prompter-а и LLM."""
+    global _prompter_chain
+    if _prompter_chain is None:
+        # JSON-режим провайдера (response_format=json_object): ответ разбирается
+        # в PromptAnalysis, обрамление ```json при этом допускается
+        _prompter_chain = prompter_prompt_template() | get_prompter_llm().with_structured_output(
+            PromptAnalysis,
+            method="json_mode",
+            include_raw=True
+        )
+    return _prompter_chain
+
+
+async def prompter_node(state: AgentState) -> dict:
+    """
+    Узел Prompter: анализирует и при необходимости уточняет запрос пользователя.
+    """
+    with DeferredStatus() as status:
+        status.write("Анализ запроса...")
         
-        if result.get("prompt_is_valid"):
+        # Если есть `user_response`, значит, это ответ на уточняющий вопрос
+        prompt = state.topic
+        questions = state.questions_for_user
+        user_response = state.user_response
+        
+        clarification = _CLARIFICATION_TEMPLATE.format(
+            questions="\n".join(questions),
+            user_response=user_response or ""
+        ) if questions else ""
+        
+        if not questions and _looks_well_formed(prompt):
+            # Первый запрос уже содержит роль, контекст и задачу -
+            # передаем его генераторам как есть, без вызова LLM
+            status.write("Запрос соответствует стандарту.")
+            return {"questions_for_user": []}
+        
+        if len(questions) == 1 and _is_yes_no(user_response):
+            # Ответ "да"/"нет" на единственный вопрос анализировать не нужно:
+            # дополняем им запрос и переходим к генераторам без вызова LLM
+            status.write("Ответ учтен, запрос дополнен.")
+            return {"topic": prompt + clarification, "questions_for_user": []}
+        
+        chain = _get_prompter_chain()
+        output = await chain.ainvoke({
+            "prompt": prompt,
+            "clarification": clarification,
+        })
+        
+        # Логируем ответ промптера
+        log_agent_response_async(
+            agent_type="prompter",
+            log_filename=state.log_filename,
+            topic=state.topic,
+            iteration=0,  # Prompter - это нулевая итерация
+            response=output["raw"].content,
+            chat_uuid=state.chat_uuid,
+            metadata={}
+        )
+        
+        result: Optional[PromptAnalysis] = output["parsed"]
+        if result is None:
+            # В случае ошибки разбора, считаем промпт валидным и пропускаем дальше
+            status.write("Ошибка анализа запроса, пропускаю...")
+            return {"questions_for_user": []}
+        
+        if result.prompt_is_valid:
             # Промпт хороший, обновляем тему и сбрасываем вопросы
-            return {"topic": result["prepared_prompt"], "questions_for_user": []}
+            return {"topic": result.prepared_prompt or prompt, "questions_for_user": []}
         else:
             # Промпт требует уточнений
-            return {"questions_for_user": result.get("clarification_questions", [])}
-            
-    except (json.JSONDecodeError, AttributeError):
-        # В случае ошибки парсинга, считаем промпт валидным и пропускаем дальше
-        st.session_state.status.write("Ошибка анализа запроса, пропускаю...")
-        return {"questions_for_user": []}
+            return {"questions_for_user": result.clarification_questions}
 
 
-def decide_after_prompter(state: AgentState) -> str:
+def decide_after_prompter(state: AgentState) -> Literal["ask_user", "generator"]:
     """
     Принимает решение после работы Prompter-а.
+    
+    Если есть вопросы, останавливаемся и ждем ответа пользователя,
+    иначе переходим к генераторам.
     """
-    if state.get("questions_for_user"):
-        # Если есть вопросы, останавливаемся и ждем ответа пользователя
-        return "ask_user"
-    else:
-        # Если вопросов нет, переходим к генераторам
-        return "generator"
-
+    return "ask_user" if state.questions_for_user else "generator"
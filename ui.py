@@ -48,8 +48,6 @@ def render_main_ui():
         st.session_state.messages = []
     if "chat_id" not in st.session_state:
         st.session_state.chat_id = None
-    if "current_graph_state" not in st.session_state:
-        st.session_state.current_graph_state = None
     if "awaiting_user_response" not in st.session_state:
         st.session_state.awaiting_user_response = False
     
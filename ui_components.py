@@ -23,13 +23,11 @@ def load_chat(chat_id: int):
     Side Effects:
         - Обновляет st.session_state.chat_id
         - Обновляет st.session_state.messages
-        - Сбрасывает состояние графа
         - Сбрасывает флаг ожидания ответа пользователя
         - Перезапускает приложение (st.rerun)
     """
     st.session_state.chat_id = chat_id
     st.session_state.messages = get_messages(chat_id)
-    st.session_state.current_graph_state = None
     st.session_state.awaiting_user_response = False
     st.rerun()
 
@@ -6,11 +6,68 @@
 ограничения на количество строк.
 """
 
+import re
 import streamlit as st
 from datetime import datetime
-from database import create_chat, add_message, get_chat_uuid
-from graph import graph_app
-from config import GRAPH_RECURSION_LIMIT
+from database import create_chat, add_message_async, flush_messages, get_chat_uuid
+from graph import has_saved_state, run_graph
+from config import TRIVIAL_PROMPT_MIN_LENGTH
+
+
+# Поля итогового состояния графа, сохраняемые с сообщением как agent_steps
+# (для отладки). Не сохраняются тема, содержимое файла, UUID чата и
+# производные строки (*_joined, critiques_text_by_generator)
+_AGENT_STEPS_FIELDS = (
+    "drafts",
+    "critiques",
+    "critiques_by_generator",
+    "questions_for_user",
+    "user_response",
+    "final_summary",
+    "iteration_count",
+    "drafts_to_redo",
+    "log_filename",
+)
+
+# Символы, недопустимые в имени лог-файла (оставляем буквы, цифры, пробел, '-' и '_')
+_UNSAFE_TOPIC_CHARS = re.compile(r'[^\w \-]')
+
+# Приветствия, на которые отвечаем без запуска агентов
+_GREETING_RE = re.compile(
+    r'(привет(ствую)?|здравствуй(те)?|добр(ый день|ый вечер|ое утро)|'
+    r'hi|hello|hey)[\s!.,)]*',
+    re.IGNORECASE
+)
+
+# Ответ на приветствие или слишком короткий запрос
+_TRIVIAL_PROMPT_REPLY = (
+    "Здравствуйте! Напишите, по какой теме составить конспект. "
+    "Например: \"Ты - опытный историк. Я готовлюсь к экзамену. "
+    "Составь конспект на тему 'Пунические войны'\"."
+)
+
+# Заголовок сообщения с уточняющими вопросами (вопросы идут списком)
+_QUESTIONS_HEADER = "Пожалуйста, ответьте на следующие вопросы для продолжения:\n\n- "
+
+# Сообщение, если граф завершился без вопросов и без конспекта
+_ERROR_MESSAGE = (
+    "К сожалению, не удалось сгенерировать конспект. "
+    "Возможно, достигнут лимит итераций без результата. "
+    "Попробуйте уточнить запрос."
+)
+
+# Исходы работы графа: (функция вывода текста, заголовок статуса, состояние статуса)
+_OUTCOMES = {
+    "questions": (st.markdown, "Ожидание ответа пользователя...", "running"),
+    "summary": (st.markdown, "Работа завершена!", "complete"),
+    "error": (st.error, "Произошла ошибка!", "error"),
+}
+
+
+def _is_trivial_prompt(prompt: str) -> bool:
+    """Проверяет, что запрос - приветствие или слишком короткий для конспекта."""
+    text = prompt.strip()
+    return len(text) < TRIVIAL_PROMPT_MIN_LENGTH or _GREETING_RE.fullmatch(text) is not None
 
 
 def process_user_input(prompt: str, file_content: str):
@@ -22,12 +79,30 @@ def process_user_input(prompt: str, file_content: str):
         file_content: Содержимое прикрепленного файла (если есть)
     
     Process:
+        0. На приветствие или слишком короткий запрос (если не ожидается
+           ответ на вопросы) отвечает подсказкой без агентов и без записи
+           в БД (обмен остается только в истории сессии)
         1. Создает новый чат, если его нет
-        2. Сохраняет сообщение пользователя в БД
+        2. Ставит сообщение пользователя в очередь на запись в БД
         3. Определяет, продолжение ли это диалога или новый запрос
         4. Запускает граф агентов с соответствующим состоянием
         5. Обрабатывает результат (вопросы, конспект или ошибка)
+        6. Дожидается записи всех сообщений в БД
     """
+    if not st.session_state.awaiting_user_response and _is_trivial_prompt(prompt):
+        # Приветствие или пустой запрос: агенты не нужны, отвечаем сразу.
+        # Такой обмен не сохраняется в БД, чтобы не создавать чаты-приветствия,
+        # но остается в истории текущей сессии до смены чата
+        st.session_state.messages.extend([
+            {'author': 'user', 'content': prompt, 'agent_steps': None},
+            {'author': 'system', 'content': _TRIVIAL_PROMPT_REPLY, 'agent_steps': None},
+        ])
+        with st.chat_message("user", avatar="🧑‍💻"):
+            st.markdown(prompt)
+        with st.chat_message("system", avatar="🤖"):
+            st.markdown(_TRIVIAL_PROMPT_REPLY)
+        return
+    
     # Создаем новый чат, если его еще нет
     if not st.session_state.chat_id:
         st.session_state.chat_id = create_chat(prompt[:50])
@@ -40,7 +115,7 @@ def process_user_input(prompt: str, file_content: str):
         chat_uuid = get_chat_uuid(st.session_state.chat_id)
     
     # Сохраняем сообщение пользователя в БД
-    add_message(st.session_state.chat_id, 'user', prompt)
+    add_message_async(st.session_state.chat_id, 'user', prompt)
     st.session_state.messages.append({
         'author': 'user',
         'content': prompt,
@@ -50,7 +125,10 @@ def process_user_input(prompt: str, file_content: str):
     # Отображаем сообщение пользователя
     with st.chat_message("user", avatar="🧑‍💻"):
         st.markdown(prompt)
-
+    
+    # Определяем, продолжение ли это диалога или новый запрос
+    resume = st.session_state.awaiting_user_response and has_saved_state(chat_uuid)
+    
     # Отображаем ответ системы
     with st.chat_message("system", avatar="🤖"):
         st.session_state.status = st.status(
@@ -58,27 +136,19 @@ def process_user_input(prompt: str, file_content: str):
             expanded=True
         )
         
-        # Определяем, продолжение ли это диалога или новый запрос
-        if (st.session_state.awaiting_user_response and
-            st.session_state.current_graph_state):
-            # Продолжение: используем сохраненное состояние
-            graph_input = st.session_state.current_graph_state
-            graph_input["user_response"] = prompt
-            # Убеждаемся, что UUID присутствует
-            if "chat_uuid" not in graph_input:
-                graph_input["chat_uuid"] = chat_uuid
+        if resume:
+            # Продолжение: состояние графа сохранено чекпойнтером,
+            # передаем только ответ пользователя
+            graph_input = {"user_response": prompt}
         else:
             # Новый запрос: создаем новое состояние
             timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            safe_topic = "".join(
-                c for c in prompt[:50]
-                if c.isalnum() or c in (' ', '-', '_')
-            ).strip().replace(" ", "_")
-            
-            if not safe_topic:
-                safe_topic = "new_request"
+            safe_topic = (
+                _UNSAFE_TOPIC_CHARS.sub('', prompt[:50]).strip().replace(" ", "_")
+                or "new_request"
+            )
             log_filename = f"{timestamp}_{safe_topic}.log"
-
+            
             graph_input = {
                 "topic": prompt,
                 "file_content": file_content,
@@ -91,78 +161,43 @@ def process_user_input(prompt: str, file_content: str):
                 "iteration_count": 0,
                 "drafts_to_redo": [],
                 "log_filename": log_filename,
-                "chat_uuid": chat_uuid
+                "chat_uuid": chat_uuid,
+                "drafts_joined": "",
+                "critiques_joined": "",
+                "critiques_text_by_generator": {}
             }
         
         # Запускаем граф агентов
-        final_state = graph_app.invoke(
-            graph_input,
-            config={"recursion_limit": GRAPH_RECURSION_LIMIT}
-        )
+        final_state = run_graph(graph_input, chat_uuid, resume=resume)
         
         # Подготавливаем метаданные для сохранения
-        agent_steps = final_state.copy()
-        agent_steps.pop("topic", None)
+        agent_steps = {
+            key: final_state[key] for key in _AGENT_STEPS_FIELDS if key in final_state
+        }
         
-        # Обрабатываем результат работы графа
+        # Обрабатываем результат работы графа: выбираем исход и его текст,
+        # вывод и сохранение общие для всех исходов
         if final_state.get("questions_for_user"):
-            # Критик задал вопросы - ждем ответа пользователя
-            st.session_state.awaiting_user_response = True
-            st.session_state.current_graph_state = final_state
-            
-            questions_text = (
-                "Пожалуйста, ответьте на следующие вопросы для продолжения:\n\n"
-                + "\n".join(f"- {q}" for q in final_state["questions_for_user"])
-            )
-            st.markdown(questions_text)
-            add_message(
-                st.session_state.chat_id,
-                'system',
-                questions_text,
-                agent_steps
-            )
-            st.session_state.status.update(
-                label="Ожидание ответа пользователя...",
-                state="running",
-                expanded=False
-            )
-            
+            # Заданы уточняющие вопросы - ждем ответа пользователя
+            outcome = "questions"
+            text = _QUESTIONS_HEADER + "\n- ".join(final_state["questions_for_user"])
         elif final_state.get("final_summary"):
             # Конспект готов - показываем результат
-            summary = final_state['final_summary']
-            st.markdown(summary)
-            add_message(
-                st.session_state.chat_id,
-                'system',
-                summary,
-                agent_steps
-            )
-            st.session_state.status.update(
-                label="Работа завершена!",
-                state="complete",
-                expanded=False
-            )
-            # Сбрасываем состояние графа
-            st.session_state.current_graph_state = None
-            st.session_state.awaiting_user_response = False
-            
+            outcome = "summary"
+            text = final_state["final_summary"]
         else:
             # Ошибка: не удалось создать конспект
-            error_message = (
-                "К сожалению, не удалось сгенерировать конспект. "
-                "Возможно, достигнут лимит итераций без результата. "
-                "Попробуйте уточнить запрос."
-            )
-            st.error(error_message)
-            add_message(
-                st.session_state.chat_id,
-                'system',
-                error_message,
-                agent_steps
-            )
-            st.session_state.status.update(
-                label="Произошла ошибка!",
-                state="error",
-                expanded=False
-            )
-
+            outcome = "error"
+            text = _ERROR_MESSAGE
+        
+        render, label, status_state = _OUTCOMES[outcome]
+        render(text)
+        add_message_async(st.session_state.chat_id, 'system', text, agent_steps)
+        st.session_state.status.update(label=label, state=status_state, expanded=False)
+        # Ответ ожидается только на вопросы; в остальных случаях
+        # сохраненное состояние графа уже удалено в run_graph
+        st.session_state.awaiting_user_response = outcome == "questions"
+        
+        # Сообщения пишутся в БД в фоне; дожидаемся записи перед
+        # завершением ответа, чтобы история чата была сохранена
+        flush_messages()